@@ -0,0 +1,399 @@
+"""Hot/cold tiering of chat messages.
+
+Chats nobody touched for ``archive_after_days`` have their messages moved
+out of ``messages`` into one gzip-compressed NDJSON blob in
+``archived_chats``. The denormalized summary columns stay on the chat, so
+the sidebar never notices. Reading or writing an archived chat moves its
+messages back first.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import gzip
+import json
+import logging
+import sys
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterable, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import case, delete, func, insert, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from . import database
+from .config import Settings, get_settings
+from .models import ArchivedChat, Chat, Message
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 100
+REHYDRATE_INSERT_BATCH_SIZE = 1000
+
+
+@dataclass
+class LatencyStats:
+    """Running totals for one kind of tiering operation."""
+
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+
+    def add(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.last_ms = elapsed_ms
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "average_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+            "last_ms": self.last_ms,
+        }
+
+
+# Per-process; the storage report adds table-wide sizes from the database.
+archive_latency = LatencyStats()
+rehydrate_latency = LatencyStats()
+
+
+def _message_record(message: Message) -> dict[str, Any]:
+    return {
+        "id": str(message.id),
+        "role": message.role,
+        "content": message.content,
+        "model_name": message.model_name,
+        "parent_id": str(message.parent_id) if message.parent_id else None,
+        "selected": message.selected,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+def _message_row(record: dict[str, Any], chat_id: uuid.UUID) -> dict[str, Any]:
+    parent_id = record.get("parent_id")
+    return {
+        "id": uuid.UUID(record["id"]),
+        "chat_id": chat_id,
+        "role": record["role"],
+        "content": record["content"],
+        "model_name": record.get("model_name"),
+        "parent_id": uuid.UUID(parent_id) if parent_id else None,
+        "selected": record.get("selected", True),
+        "created_at": datetime.fromisoformat(record["created_at"]),
+    }
+
+
+def encode_messages(records: Iterable[dict[str, Any]]) -> bytes:
+    """Serialize message records as gzip-compressed NDJSON."""
+    lines = (
+        json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        for record in records
+    )
+    return gzip.compress("".join(lines).encode("utf-8"))
+
+
+def decode_messages(payload: bytes) -> list[dict[str, Any]]:
+    """Inverse of ``encode_messages``."""
+    return [
+        json.loads(line)
+        for line in gzip.decompress(payload).splitlines()
+        if line.strip()
+    ]
+
+
+def _ordered_messages(chat_id: uuid.UUID):
+    # Parents sort before their replies, so rows can be re-inserted in order.
+    return (
+        select(Message)
+        .where(Message.chat_id == chat_id)
+        .order_by(
+            Message.created_at,
+            case((Message.role == "user", 0), else_=1),
+            Message.id,
+        )
+    )
+
+
+async def archive_chat(session: AsyncSession, chat_id: uuid.UUID) -> int:
+    """Move a chat's messages into the cold store; the caller commits.
+
+    ``updated_at`` is written back unchanged so archiving neither reorders
+    the chat list nor changes any ETag. Returns the number of messages moved.
+    """
+    started = time.perf_counter()
+    messages = list((await session.execute(_ordered_messages(chat_id))).scalars())
+    payload = encode_messages(_message_record(m) for m in messages)
+    session.add(
+        ArchivedChat(
+            chat_id=chat_id,
+            payload=payload,
+            message_count=len(messages),
+            payload_bytes=len(payload),
+        )
+    )
+    await session.execute(delete(Message).where(Message.chat_id == chat_id))
+    await session.execute(
+        update(Chat)
+        .where(Chat.id == chat_id)
+        .values(archived_at=func.now(), updated_at=Chat.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    await session.flush()
+    archive_latency.add((time.perf_counter() - started) * 1000)
+    return len(messages)
+
+
+async def rehydrate_chat(session: AsyncSession, chat_id: uuid.UUID) -> bool:
+    """Move a chat's messages back from the cold store; the caller commits.
+
+    The archive row is locked first, so concurrent requests for the same
+    chat rehydrate it once. ``rehydrated_at`` is set so the archive job
+    treats the chat as active again. Returns False when there was nothing
+    to restore.
+    """
+    started = time.perf_counter()
+    archived = (
+        await session.execute(
+            select(ArchivedChat)
+            .where(ArchivedChat.chat_id == chat_id)
+            .with_for_update()
+        )
+    ).scalar_one_or_none()
+    if archived is None:
+        return False
+
+    rows = [
+        _message_row(record, chat_id) for record in decode_messages(archived.payload)
+    ]
+    for start in range(0, len(rows), REHYDRATE_INSERT_BATCH_SIZE):
+        await session.execute(
+            insert(Message), rows[start : start + REHYDRATE_INSERT_BATCH_SIZE]
+        )
+    await session.delete(archived)
+    await session.execute(
+        update(Chat)
+        .where(Chat.id == chat_id)
+        .values(
+            archived_at=None, rehydrated_at=func.now(), updated_at=Chat.updated_at
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await session.flush()
+    rehydrate_latency.add((time.perf_counter() - started) * 1000)
+    return True
+
+
+async def ensure_hot(chat_id: uuid.UUID, user_id: uuid.UUID) -> bool:
+    """Rehydrate an archived chat of ``user_id`` in its own primary transaction.
+
+    The commit counts as a write by ``user_id``, so their next reads stay on
+    the primary until replicas have caught up.
+    """
+    if database.SessionLocal is None:
+        raise RuntimeError("Database engine has not been initialised.")
+
+    async with database.SessionLocal() as session:
+        session.info["user_id"] = user_id
+        owned = await session.scalar(
+            select(Chat.id).where(Chat.id == chat_id, Chat.user_id == user_id)
+        )
+        if owned is None:
+            return False
+        rehydrated = await rehydrate_chat(session, chat_id)
+        await session.commit()
+    return rehydrated
+
+
+@contextlib.asynccontextmanager
+async def hot_session(
+    session: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID
+) -> AsyncIterator[AsyncSession]:
+    """Yield a session that sees ``chat_id``'s messages.
+
+    Hot chats are read through ``session`` itself. An archived chat is
+    rehydrated on the primary first, and the primary then serves the read
+    because replicas may not have the rows yet. Enter this only after any
+    conditional-request check, so a 304 never rehydrates.
+    """
+    archived_at = await session.scalar(
+        select(Chat.archived_at).where(Chat.id == chat_id)
+    )
+    if archived_at is None:
+        yield session
+        return
+    await ensure_hot(chat_id, user_id)
+    async with database.SessionLocal() as primary:
+        yield primary
+
+
+async def archive_idle_chats(
+    idle_days: int, *, batch_size: int = ARCHIVE_BATCH_SIZE
+) -> int:
+    """Archive every chat untouched for ``idle_days``, one batch per transaction.
+
+    A chat counts as touched when it was updated or rehydrated.
+
+    Selected chats are row-locked with ``SKIP LOCKED``, so several workers
+    can run the job at once and a chat being written to is left for later.
+    Returns the number of chats archived.
+    """
+    if database.SessionLocal is None:
+        raise RuntimeError("Database engine has not been initialised.")
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=idle_days)
+    archived = 0
+    while True:
+        async with database.SessionLocal() as session:
+            chat_ids = list(
+                (
+                    await session.execute(
+                        select(Chat.id)
+                        .where(
+                            Chat.archived_at.is_(None),
+                            Chat.message_count > 0,
+                            Chat.updated_at < cutoff,
+                            or_(
+                                Chat.rehydrated_at.is_(None),
+                                Chat.rehydrated_at < cutoff,
+                            ),
+                        )
+                        .order_by(Chat.updated_at)
+                        .limit(batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                ).scalars()
+            )
+            if not chat_ids:
+                return archived
+            for chat_id in chat_ids:
+                await archive_chat(session, chat_id)
+            await session.commit()
+        archived += len(chat_ids)
+
+
+async def load_archived_records(
+    session: AsyncSession, chat_id: uuid.UUID
+) -> list[dict[str, Any]]:
+    """Return the archived message records of a chat without rehydrating it."""
+    payload = await session.scalar(
+        select(ArchivedChat.payload).where(ArchivedChat.chat_id == chat_id)
+    )
+    return decode_messages(payload) if payload is not None else []
+
+
+async def _messages_partitioned(conn: AsyncConnection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    result = await conn.execute(
+        text("""
+            SELECT 1
+            FROM pg_partitioned_table
+            WHERE partrelid = to_regclass('messages')
+        """)
+    )
+    return result.scalar() is not None
+
+
+async def ensure_message_partitions(months_ahead: int) -> None:
+    """Create upcoming monthly ``messages`` partitions, if the table is partitioned.
+
+    Relies on ``create_message_partitions`` from the partitioning migration.
+    """
+    async with database.get_engine().begin() as conn:
+        if await _messages_partitioned(conn):
+            await conn.execute(
+                text("SELECT create_message_partitions(:months)"),
+                {"months": months_ahead},
+            )
+
+
+async def storage_report(session: AsyncSession) -> dict[str, Any]:
+    """Return hot/cold sizes and this process' tiering latencies."""
+    hot = await session.execute(
+        select(func.count(Chat.id), func.coalesce(func.sum(Chat.message_count), 0))
+        .where(Chat.archived_at.is_(None))
+    )
+    hot_chats, hot_messages = hot.one()
+    cold = await session.execute(
+        select(
+            func.count(ArchivedChat.chat_id),
+            func.coalesce(func.sum(ArchivedChat.message_count), 0),
+            func.coalesce(func.sum(ArchivedChat.payload_bytes), 0),
+        )
+    )
+    cold_chats, cold_messages, cold_bytes = cold.one()
+    return {
+        "hot": {"chats": int(hot_chats), "messages": int(hot_messages)},
+        "cold": {
+            "chats": int(cold_chats),
+            "messages": int(cold_messages),
+            "bytes": int(cold_bytes),
+        },
+        "archive": archive_latency.to_dict(),
+        "rehydrate": rehydrate_latency.to_dict(),
+    }
+
+
+_archive_task: asyncio.Task[None] | None = None
+
+
+async def _maintain_periodically(settings: Settings) -> None:
+    while True:
+        try:
+            await ensure_message_partitions(settings.message_partition_months_ahead)
+            if settings.archive_after_days is not None:
+                archived = await archive_idle_chats(
+                    settings.archive_after_days,
+                    batch_size=settings.archive_batch_size,
+                )
+                if archived:
+                    logger.info("Archived %d idle chats", archived)
+        except Exception:
+            logger.exception("Storage maintenance failed")
+        await asyncio.sleep(settings.archive_interval_seconds)
+
+
+async def init_archiver(settings: Settings) -> None:
+    """Start the background archiving and partition maintenance task."""
+    global _archive_task
+
+    if _archive_task is None:
+        _archive_task = asyncio.create_task(_maintain_periodically(settings))
+
+
+async def close_archiver() -> None:
+    """Stop the background task, abandoning any batch in progress."""
+    global _archive_task
+
+    if _archive_task is not None:
+        _archive_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _archive_task
+        _archive_task = None
+
+
+async def _main(idle_days: Sequence[str]) -> None:
+    settings = get_settings()
+    await database.init_engine(settings)
+    try:
+        days = int(idle_days[0]) if idle_days else settings.archive_after_days
+        if days is None:
+            raise SystemExit("Pass the idle days or set ARCHIVE_AFTER_DAYS.")
+        archived = await archive_idle_chats(
+            days, batch_size=settings.archive_batch_size
+        )
+        logger.info("Archived %d idle chats", archived)
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1:]))
@@ -2,16 +2,22 @@
 
 from __future__ import annotations
 
+import hashlib
+import hmac
+import math
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
-from jose import jwt
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from .config import Settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
+READ_AFTER_HEADER = "X-Read-After"
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -41,3 +47,52 @@ def create_access_token(
     to_encode.update({"sub": subject, "exp": expire})
     return jwt.encode(to_encode, settings.secret_key, algorithm=ALGORITHM)
 
+
+def decode_access_token(token: str, settings: Settings) -> uuid.UUID:
+    """Return the user id stored in a valid access token.
+
+    Raises ``JWTError`` or ``ValueError`` when the token cannot be trusted.
+    """
+    payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
+    user_id: str | None = payload.get("sub")
+    if user_id is None:
+        raise JWTError("Token has no subject.")
+    return uuid.UUID(user_id)
+
+
+def _read_after_signature(message: str, settings: Settings) -> str:
+    return hmac.new(
+        settings.secret_key.encode(), f"read-after:{message}".encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def create_read_after_token(
+    user_id: uuid.UUID, settings: Settings, *, now: float | None = None
+) -> str:
+    """Sign a short-lived marker saying ``user_id`` has just written.
+
+    Clients echo it in the ``X-Read-After`` header so that any worker keeps
+    their reads on the primary until replicas have caught up. It is not a
+    JWT, so it can never pass as an access token.
+    """
+    issued_at = time.time() if now is None else now
+    expires = math.ceil(issued_at + settings.read_your_writes_seconds)
+    message = f"{user_id}.{expires}"
+    return f"{message}.{_read_after_signature(message, settings)}"
+
+
+def read_after_active(
+    token: str, user_id: uuid.UUID, settings: Settings, *, now: float | None = None
+) -> bool:
+    """Return True for an unexpired, untampered read-after token of ``user_id``."""
+    try:
+        subject, expires, signature = token.split(".")
+        expires_at = int(expires)
+    except ValueError:
+        return False
+    expected = _read_after_signature(f"{subject}.{expires}", settings)
+    return (
+        hmac.compare_digest(signature, expected)
+        and subject == str(user_id)
+        and expires_at > (time.time() if now is None else now)
+    )
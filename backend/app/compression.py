@@ -0,0 +1,268 @@
+"""Response compression middleware with gzip, brotli and zstd support."""
+
+from __future__ import annotations
+
+import zlib
+from collections import OrderedDict
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import Settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Preferred first when the client weights encodings equally.
+PREFERENCE = ("zstd", "br", "gzip")
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """Compress ``data`` and flush it so the client can decode it now."""
+
+    def finish(self) -> bytes:
+        """Return the trailing bytes that end the stream."""
+
+
+class GzipCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encodings() -> tuple[str, ...]:
+    """Return the encodings usable with the installed libraries."""
+    return tuple(
+        encoding
+        for encoding in PREFERENCE
+        if (encoding != "br" or brotli is not None)
+        and (encoding != "zstd" or zstandard is not None)
+    )
+
+
+def negotiate(accept_encoding: str, supported: tuple[str, ...]) -> str | None:
+    """Pick the best supported encoding from an ``Accept-Encoding`` header."""
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    best: str | None = None
+    best_weight = 0.0
+    for encoding in supported:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class CompressionMiddleware:
+    """Compress responses according to the client's ``Accept-Encoding``.
+
+    Single-body responses below ``minimum_size`` are sent as-is. Responses
+    carrying an ``ETag`` are compressed once and then served from a small LRU
+    cache. Streaming responses are compressed chunk by chunk and every chunk
+    is flushed, so compression never holds back SSE events or token deltas.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+        cache_entries: int = 256,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self.cache_entries = cache_entries
+        self.encodings = available_encodings()
+        self._cache: OrderedDict[tuple[str, str, str], bytes] = OrderedDict()
+
+    def _compressor(self, encoding: str) -> Compressor:
+        if encoding == "zstd":
+            return ZstdCompressor(self.zstd_level)
+        if encoding == "br":
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate(accept, self.encodings) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, scope["path"], encoding, send)
+        await self.app(scope, receive, responder)
+
+    def cached(self, key: tuple[str, str, str]) -> bytes | None:
+        body = self._cache.get(key)
+        if body is not None:
+            self._cache.move_to_end(key)
+        return body
+
+    def store(self, key: tuple[str, str, str], body: bytes) -> None:
+        if self.cache_entries <= 0:
+            return
+        self._cache[key] = body
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+
+class _CompressionResponder:
+    """Per-request ``send`` wrapper that decides whether and how to compress."""
+
+    def __init__(
+        self, middleware: CompressionMiddleware, path: str, encoding: str, send: Send
+    ) -> None:
+        self.middleware = middleware
+        self.path = path
+        self.encoding = encoding
+        self.send = send
+        self.start: Message | None = None
+        self.compressor: Compressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 304)
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body:
+                await self._send_whole(start, body)
+                return
+            # Streaming response: compress and flush every chunk.
+            self.compressor = self.middleware._compressor(self.encoding)
+            headers = MutableHeaders(raw=start["headers"])
+            del headers["content-length"]
+            headers["content-encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            await self.send(start)
+
+        assert self.compressor is not None
+        chunk = self.compressor.compress(body) if body else b""
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self.send(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
+
+    async def _send_whole(self, start: Message, body: bytes) -> None:
+        headers = MutableHeaders(raw=start["headers"])
+        if len(body) < self.middleware.minimum_size:
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        etag = headers.get("etag")
+        key = (self.path, etag or "", self.encoding)
+        compressed = self.middleware.cached(key) if etag else None
+        if compressed is None:
+            compressor = self.middleware._compressor(self.encoding)
+            compressed = compressor.compress(body) + compressor.finish()
+            if etag:
+                self.middleware.store(key, compressed)
+
+        headers["content-encoding"] = self.encoding
+        headers["content-length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": compressed})
+
+
+def middleware_options(settings: Settings) -> dict[str, int]:
+    """Return ``CompressionMiddleware`` options configured in ``settings``."""
+    return {
+        "minimum_size": settings.compression_minimum_size,
+        "gzip_level": settings.compression_gzip_level,
+        "brotli_quality": settings.compression_brotli_quality,
+        "zstd_level": settings.compression_zstd_level,
+        "cache_entries": settings.compression_cache_entries,
+    }
@@ -2,24 +2,57 @@
 
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import itertools
+import logging
+import time
+import uuid
 from collections.abc import AsyncGenerator
 
+from sqlalchemy import Table, event, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import Session
 
 from .config import Settings
 
+logger = logging.getLogger(__name__)
+
 engine: AsyncEngine | None = None
 SessionLocal: async_sessionmaker[AsyncSession] | None = None
 
 
+class Replica:
+    """A read-only engine together with its last known health."""
+
+    def __init__(self, url: str, settings: Settings) -> None:
+        self.engine = create_async_engine(url, echo=settings.debug_sql, future=True)
+        self.sessionmaker = async_sessionmaker(
+            bind=self.engine,
+            expire_on_commit=False,
+            class_=AsyncSession,
+        )
+        self.healthy = True
+
+
+replicas: list[Replica] = []
+_replica_cursor = itertools.count()
+_health_task: asyncio.Task[None] | None = None
+_read_your_writes_seconds = 0.0
+# Users who wrote recently, mapped to the monotonic time of that write.
+_recent_writers: dict[uuid.UUID, float] = {}
+_writers_pruned_at = 0.0
+
+
 async def init_engine(settings: Settings) -> None:
     """Initialise the asynchronous SQLAlchemy engine and session factory."""
-    global engine, SessionLocal
+    global engine, SessionLocal, _health_task, _read_your_writes_seconds
 
     if engine is None:
         engine = create_async_engine(
@@ -32,11 +65,27 @@ async def init_engine(settings: Settings) -> None:
             expire_on_commit=False,
             class_=AsyncSession,
         )
+        _read_your_writes_seconds = settings.read_your_writes_seconds
+        replicas.extend(Replica(url, settings) for url in settings.database_replica_urls)
+        if replicas:
+            _health_task = asyncio.create_task(
+                _check_replicas(settings.replica_health_check_seconds)
+            )
 
 
 async def dispose_engine() -> None:
     """Dispose the engine and drop references."""
-    global engine, SessionLocal
+    global engine, SessionLocal, _health_task
+
+    if _health_task is not None:
+        _health_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _health_task
+        _health_task = None
+    for replica in replicas:
+        await replica.engine.dispose()
+    replicas.clear()
+    _recent_writers.clear()
 
     if engine is not None:
         await engine.dispose()
@@ -44,6 +93,80 @@ async def dispose_engine() -> None:
         SessionLocal = None
 
 
+async def _ping(replica: Replica) -> None:
+    async with replica.engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def _check_replicas(interval: float) -> None:
+    while True:
+        for replica in replicas:
+            try:
+                # Connecting can hang as well, so the timeout covers both.
+                await asyncio.wait_for(_ping(replica), interval)
+            except Exception:
+                if replica.healthy:
+                    logger.warning("Replica %s is unavailable", replica.engine.url)
+                replica.healthy = False
+            else:
+                if not replica.healthy:
+                    logger.info("Replica %s is available again", replica.engine.url)
+                replica.healthy = True
+        await asyncio.sleep(interval)
+
+
+def mark_user_write(user_id: uuid.UUID) -> None:
+    """Pin ``user_id``'s reads to the primary for the read-your-writes window."""
+    global _writers_pruned_at
+
+    if not replicas:
+        return
+    now = time.monotonic()
+    _recent_writers[user_id] = now
+    # Users who never read again would otherwise stay in the dict forever.
+    if now - _writers_pruned_at >= _read_your_writes_seconds:
+        _writers_pruned_at = now
+        for writer, written_at in list(_recent_writers.items()):
+            if now - written_at >= _read_your_writes_seconds:
+                del _recent_writers[writer]
+
+
+def _wrote_recently(user_id: uuid.UUID) -> bool:
+    written_at = _recent_writers.get(user_id)
+    if written_at is None:
+        return False
+    if time.monotonic() - written_at < _read_your_writes_seconds:
+        return True
+    del _recent_writers[user_id]
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _note_pending_write(session: Session, flush_context: object) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_writer(session: Session) -> None:
+    # Sessions opt in by storing the acting user's id in ``session.info``.
+    user_id = session.info.get("user_id")
+    if user_id is not None and session.info.pop("wrote", False):
+        mark_user_write(user_id)
+
+
+def _read_sessionmaker(
+    user_id: uuid.UUID | None, pinned: bool = False
+) -> async_sessionmaker[AsyncSession]:
+    if SessionLocal is None:
+        raise RuntimeError("Database engine has not been initialised.")
+    if pinned or (user_id is not None and _wrote_recently(user_id)):
+        return SessionLocal
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return SessionLocal
+    return healthy[next(_replica_cursor) % len(healthy)].sessionmaker
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     """Yield an AsyncSession bound to the application engine."""
     if SessionLocal is None:
@@ -53,9 +176,33 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def read_session(
+    user_id: uuid.UUID | None = None,
+    *,
+    pinned: bool = False,
+) -> AsyncGenerator[AsyncSession, None]:
+    """Yield a session for read-only work, on a replica when one is usable.
+
+    Falls back to the primary when no replica is configured or healthy, when
+    ``pinned`` is set, and for users who wrote through this process within
+    the read-your-writes window. Writes made through other workers reach the
+    caller as ``pinned`` via the client's read-after token.
+    """
+    async with _read_sessionmaker(user_id, pinned)() as session:
+        yield session
+
+
 def get_engine() -> AsyncEngine:
     """Return the current engine instance."""
     if engine is None:
         raise RuntimeError("Database engine has not been initialised.")
     return engine
 
+
+def upsert_statement(dialect_name: str, table: Table):
+    """Return a dialect-specific INSERT that supports ``on_conflict_do_update``."""
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise RuntimeError(f"Upserts are not supported for dialect {dialect_name!r}.")
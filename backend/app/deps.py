@@ -2,50 +2,140 @@
 
 from __future__ import annotations
 
+import hmac
 import uuid
+from collections.abc import AsyncGenerator
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from jose import JWTError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from . import database
+from .auth import (
+    READ_AFTER_HEADER,
+    create_read_after_token,
+    decode_access_token,
+    read_after_active,
+)
 from .config import Settings, get_settings
-from .database import get_session
+from .database import get_session, read_session
 from .models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
 
-async def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)],
-    session: Annotated[AsyncSession, Depends(get_session)],
-    settings: Annotated[Settings, Depends(get_settings)],
-) -> User:
-    """Return the authenticated user based on a JWT bearer token."""
-    credentials_exception = HTTPException(
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+async def _load_user(token: str, session: AsyncSession, settings: Settings) -> User:
     try:
-        payload = jwt.decode(
-            token, settings.secret_key, algorithms=["HS256"]
-        )
-        user_id: str | None = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        user_uuid = uuid.UUID(user_id)
+        user_uuid = decode_access_token(token, settings)
     except (JWTError, ValueError):
-        raise credentials_exception
+        raise _credentials_exception()
 
     result = await session.execute(
         select(User).where(User.id == user_uuid)
     )
     user = result.scalar_one_or_none()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
+
+def issue_read_after(
+    response: Response, user_id: uuid.UUID, settings: Settings
+) -> None:
+    """Hand the client a read-after token when reads may go to replicas.
+
+    Other workers cannot see this process' writers, so the client carries
+    the pin and echoes it back on its next reads.
+    """
+    if settings.database_replica_urls:
+        response.headers[READ_AFTER_HEADER] = create_read_after_token(
+            user_id, settings
+        )
+
+
+async def get_current_user(
+    request: Request,
+    response: Response,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Annotated[AsyncSession, Depends(get_session)],
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> User:
+    """Return the authenticated user based on a JWT bearer token."""
+    user = await _load_user(token, session, settings)
+    # Lets the session report this user's writes for read-your-writes routing.
+    session.info["user_id"] = user.id
+    if request.method not in SAFE_METHODS:
+        issue_read_after(response, user.id, settings)
+    return user
+
+
+def require_internal_token(
+    settings: Annotated[Settings, Depends(get_settings)],
+    x_internal_token: Annotated[str | None, Header()] = None,
+) -> None:
+    """Guard operator endpoints, which only exist once a token is configured."""
+    expected = settings.internal_api_token
+    if expected is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if x_internal_token is None or not hmac.compare_digest(
+        x_internal_token, expected
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid internal token.",
+        )
+
+
+async def get_read_session(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    read_after: Annotated[str | None, Header(alias=READ_AFTER_HEADER)] = None,
+) -> AsyncGenerator[AsyncSession, None]:
+    """Yield a read-only session routed to a replica when possible.
+
+    A valid ``X-Read-After`` token pins the read to the primary.
+    """
+    try:
+        user_id = decode_access_token(token, settings)
+    except (JWTError, ValueError):
+        user_id = None
+    pinned = (
+        user_id is not None
+        and read_after is not None
+        and read_after_active(read_after, user_id, settings)
+    )
+    async for session in read_session(user_id, pinned=pinned):
+        yield session
+
+
+async def get_current_reader(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> User:
+    """Like ``get_current_user`` but loaded through the read-only session.
+
+    A replica may not have caught up with a user who just registered, so a
+    miss there is retried on the primary before the token is rejected.
+    """
+    try:
+        return await _load_user(token, session, settings)
+    except HTTPException:
+        if database.SessionLocal is None or session.bind is database.engine:
+            raise
+    async with database.SessionLocal() as primary:
+        return await _load_user(token, primary, settings)
+
@@ -0,0 +1,345 @@
+"""Event bus used to fan out chat changes across connections and workers."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Callable, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from . import database
+from .config import Settings
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+CHAT_CREATED = "chat.created"
+CHAT_RENAMED = "chat.renamed"
+CHAT_DELETED = "chat.deleted"
+CHATS_IMPORTED = "chats.imported"
+MESSAGE_APPENDED = "message.appended"
+MESSAGE_SELECTED = "message.selected"
+GENERATION_STARTED = "generation.started"
+GENERATION_PROGRESS = "generation.progress"
+GENERATION_COMPLETED = "generation.completed"
+GENERATION_FAILED = "generation.failed"
+GENERATION_CANCELLED = "generation.cancelled"
+
+NOTIFY_CHANNEL = "chat_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+NOTIFY_MAX_BYTES = 7900
+LISTEN_HEALTH_CHECK_SECONDS = 30.0
+RECONNECT_MAX_DELAY_SECONDS = 30.0
+
+
+@dataclass(frozen=True)
+class Event:
+    """A change that concerns every connection of ``user_id``."""
+
+    type: str
+    user_id: uuid.UUID
+    chat_id: uuid.UUID | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "type": self.type,
+            "user_id": str(self.user_id),
+            "chat_id": str(self.chat_id) if self.chat_id else None,
+            "data": self.data,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"), default=str)
+
+    @classmethod
+    def from_json(cls, payload: str) -> Event:
+        raw = json.loads(payload)
+        return cls(
+            type=raw["type"],
+            user_id=uuid.UUID(raw["user_id"]),
+            chat_id=uuid.UUID(raw["chat_id"]) if raw.get("chat_id") else None,
+            data=raw.get("data") or {},
+        )
+
+
+def turn_completed(
+    user_id: uuid.UUID, chat_id: uuid.UUID, messages: Sequence[Message]
+) -> list[Event]:
+    """Events announcing ``messages`` and the end of the generation.
+
+    The last message is the reply the generation produced.
+    """
+    return [
+        *(
+            Event(
+                MESSAGE_APPENDED,
+                user_id,
+                chat_id,
+                {"message_id": str(message.id), "role": message.role},
+            )
+            for message in messages
+        ),
+        Event(
+            GENERATION_COMPLETED,
+            user_id,
+            chat_id,
+            {"message_id": str(messages[-1].id)},
+        ),
+    ]
+
+
+EventListener = Callable[[Event], None]
+
+
+class EventBus(ABC):
+    """Deliver published events to local per-user subscriber queues.
+
+    Subclasses decide how an event travels from ``publish`` to ``_deliver``.
+    Slow subscribers never block publishers: when a queue is full its oldest
+    event is dropped.
+    """
+
+    def __init__(self, queue_size: int = 256) -> None:
+        self.queue_size = queue_size
+        self._subscribers: dict[uuid.UUID, set[asyncio.Queue[Event]]] = {}
+        self._listeners: list[EventListener] = []
+
+    async def start(self) -> None:
+        """Connect to the transport, if any."""
+
+    async def close(self) -> None:
+        """Release transport resources."""
+
+    @abstractmethod
+    async def publish(self, *events: Event) -> None:
+        """Send ``events`` in order.
+
+        Callers publish after committing, so implementations log transport
+        failures instead of raising them.
+        """
+
+    def add_listener(self, listener: EventListener) -> None:
+        """Call ``listener`` for every event, e.g. to invalidate caches."""
+        self._listeners.append(listener)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: uuid.UUID) -> AsyncIterator[asyncio.Queue[Event]]:
+        """Yield a queue receiving every event for ``user_id`` until exit."""
+        queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _deliver(self, event: Event) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Event listener failed for %s", event.type)
+
+        for queue in tuple(self._subscribers.get(event.user_id, ())):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+class InProcessEventBus(EventBus):
+    """Bus for a single worker: events never leave the process."""
+
+    async def publish(self, *events: Event) -> None:
+        for event in events:
+            self._deliver(event)
+
+
+class PostgresEventBus(EventBus):
+    """Bus shared by all workers through Postgres ``LISTEN/NOTIFY``.
+
+    Every worker, including the publisher, receives events via its listening
+    connection, so local delivery follows the same path as remote delivery.
+
+    The listening connection is watched: when it terminates or stops
+    answering health checks it is replaced, with backoff, and the listener is
+    added again. Events sent while it is down are lost.
+    """
+
+    def __init__(self, queue_size: int = 256) -> None:
+        super().__init__(queue_size)
+        self._connection: AsyncConnection | None = None
+        self._watch_task: asyncio.Task[None] | None = None
+        self._reconnect_task: asyncio.Task[None] | None = None
+        self._closing = False
+
+    async def start(self) -> None:
+        if self._connection is not None:
+            return
+        self._closing = False
+        await self._connect()
+        self._watch_task = asyncio.create_task(self._watch())
+
+    async def close(self) -> None:
+        self._closing = True
+        for task in (self._watch_task, self._reconnect_task):
+            if task is not None:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        self._watch_task = self._reconnect_task = None
+        await self._disconnect()
+
+    async def _connect(self) -> None:
+        connection = await database.get_engine().connect()
+        try:
+            raw = await connection.get_raw_connection()
+            driver = raw.driver_connection
+            await driver.add_listener(NOTIFY_CHANNEL, self._on_notify)
+            driver.add_termination_listener(self._on_terminate)
+        except BaseException:
+            await connection.close()
+            raise
+        self._connection = connection
+
+    async def _disconnect(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            raw = await connection.get_raw_connection()
+            driver = raw.driver_connection
+            driver.remove_termination_listener(self._on_terminate)
+            await driver.remove_listener(NOTIFY_CHANNEL, self._on_notify)
+        except Exception:
+            # The connection is already broken; drop it from the pool.
+            with contextlib.suppress(Exception):
+                await connection.invalidate()
+        finally:
+            with contextlib.suppress(Exception):
+                await connection.close()
+
+    def _on_terminate(self, connection: Any) -> None:
+        if not self._closing:
+            logger.warning("Event bus listener connection was closed")
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self) -> None:
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        await self._disconnect()
+        delay = 0.5
+        while not self._closing:
+            try:
+                await self._connect()
+            except Exception:
+                logger.warning("Event bus reconnect failed; retrying in %.1fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+            else:
+                logger.info("Event bus listener reconnected")
+                return
+
+    async def _watch(self) -> None:
+        # Catches half-open connections that never report termination.
+        while True:
+            await asyncio.sleep(LISTEN_HEALTH_CHECK_SECONDS)
+            connection = self._connection
+            if connection is None:
+                continue
+            try:
+                raw = await connection.get_raw_connection()
+                await asyncio.wait_for(
+                    raw.driver_connection.execute("SELECT 1"),
+                    LISTEN_HEALTH_CHECK_SECONDS,
+                )
+            except Exception:
+                logger.warning("Event bus listener connection is unresponsive")
+                self._schedule_reconnect()
+
+    async def publish(self, *events: Event) -> None:
+        payloads = []
+        for event in events:
+            payload = event.to_json()
+            if len(payload.encode("utf-8")) > NOTIFY_MAX_BYTES:
+                payload = Event(
+                    event.type, event.user_id, event.chat_id, {"truncated": True}
+                ).to_json()
+            payloads.append({"channel": NOTIFY_CHANNEL, "payload": payload})
+        if not payloads:
+            return
+        try:
+            # One transaction: listeners receive the batch together at commit.
+            async with database.get_engine().connect() as conn:
+                for params in payloads:
+                    await conn.execute(
+                        text("SELECT pg_notify(:channel, :payload)"), params
+                    )
+                await conn.commit()
+        except Exception:
+            logger.exception(
+                "Failed to publish %s", ", ".join(event.type for event in events)
+            )
+
+    def _on_notify(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            event = Event.from_json(payload)
+        except (KeyError, ValueError):
+            logger.warning("Ignoring malformed event payload on %s", channel)
+            return
+        self._deliver(event)
+
+
+bus: EventBus | None = None
+
+
+async def init_event_bus(settings: Settings) -> None:
+    """Create and start the configured event bus."""
+    global bus
+
+    if bus is None:
+        if settings.event_bus_backend == "memory":
+            candidate: EventBus = InProcessEventBus(settings.event_queue_size)
+        elif settings.event_bus_backend == "postgres":
+            candidate = PostgresEventBus(settings.event_queue_size)
+        else:
+            raise ValueError(
+                f"Unknown event bus backend: {settings.event_bus_backend!r}"
+            )
+        await candidate.start()
+        bus = candidate
+
+
+async def close_event_bus() -> None:
+    """Stop the event bus and drop the reference."""
+    global bus
+
+    if bus is not None:
+        try:
+            await bus.close()
+        finally:
+            bus = None
+
+
+def get_event_bus() -> EventBus:
+    """Return the active event bus."""
+    if bus is None:
+        raise RuntimeError("Event bus has not been initialised.")
+    return bus
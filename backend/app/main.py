@@ -1,16 +1,46 @@
 from __future__ import annotations
 
+import asyncio
 from contextlib import asynccontextmanager
+from typing import Any
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
+from .archive import close_archiver, init_archiver, storage_report
+from .auth import READ_AFTER_HEADER
+from .compression import CompressionMiddleware, middleware_options
 from .config import get_settings
-from .database import dispose_engine, get_engine, init_engine
+from .database import dispose_engine, get_engine, get_session, init_engine
+from .deps import require_internal_token
+from .events import close_event_bus, init_event_bus
 from .models import Base
-from .routers import auth, chats, profile
+from .ratelimit import RateLimitMiddleware, backend_from_settings, limits_from_settings
+from .regeneration import link_orphan_replies
+from .routers import auth, chats, profile, realtime
+from .summaries import repair_chat_summaries
+from .usage import close_usage_ledger, init_usage_ledger
+
+
+async def _ensure_column(
+    conn: AsyncConnection, table: str, column: str, ddl: str
+) -> bool:
+    """Add ``column`` to ``table`` if it is missing; return True when added."""
+    result = await conn.execute(
+        text("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name = :table AND column_name = :column
+        """),
+        {"table": table, "column": column},
+    )
+    if result.scalar() is not None:
+        return False
+    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
 
 
 def create_app() -> FastAPI:
@@ -23,40 +53,108 @@ def create_app() -> FastAPI:
         engine = get_engine()
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
-            # Check if settings column exists, if not add it
-            result = await conn.execute(
-                text("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'users' AND column_name = 'settings'
-                """)
+            await _ensure_column(conn, "users", "settings", "JSONB DEFAULT NULL")
+            summaries_added = False
+            for column, ddl in (
+                ("message_count", "INTEGER NOT NULL DEFAULT 0"),
+                ("last_message_at", "TIMESTAMP WITH TIME ZONE"),
+                ("last_message_preview", "VARCHAR(200)"),
+            ):
+                summaries_added |= await _ensure_column(conn, "chats", column, ddl)
+            await _ensure_column(
+                conn, "chats", "version", "INTEGER NOT NULL DEFAULT 0"
             )
-            if result.scalar() is None:
+            for column in ("archived_at", "rehydrated_at"):
+                await _ensure_column(conn, "chats", column, "TIMESTAMP WITH TIME ZONE")
+            if await _ensure_column(
+                conn, "archived_chats", "payload_bytes", "INTEGER NOT NULL DEFAULT 0"
+            ):
                 await conn.execute(
-                    text("ALTER TABLE users ADD COLUMN settings JSONB DEFAULT NULL")
+                    text("UPDATE archived_chats SET payload_bytes = length(payload)")
                 )
+            parents_added = await _ensure_column(
+                conn,
+                "messages",
+                "parent_id",
+                "UUID REFERENCES messages (id) ON DELETE CASCADE",
+            )
+            await _ensure_column(
+                conn, "messages", "selected", "BOOLEAN NOT NULL DEFAULT TRUE"
+            )
+            await _ensure_column(
+                conn, "usage_daily", "cached_prompt_tokens", "BIGINT NOT NULL DEFAULT 0"
+            )
+            for index_ddl in (
+                "ix_chats_user_id_updated_at ON chats (user_id, updated_at)",
+                "ix_messages_parent_id ON messages (parent_id)",
+                # Lets the archive job find idle chats without scanning cold ones.
+                "ix_chats_hot_updated_at ON chats (updated_at)"
+                " WHERE archived_at IS NULL",
+            ):
+                await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_ddl}"))
+        backfills: list[asyncio.Task[int]] = []
+        # Backfill new columns once, when they are added, without delaying startup.
+        if summaries_added:
+            backfills.append(asyncio.create_task(repair_chat_summaries()))
+        if parents_added:
+            # Replies from before parent links could otherwise never be reselected.
+            backfills.append(asyncio.create_task(link_orphan_replies()))
+        await init_usage_ledger(settings)
+        await init_event_bus(settings)
+        await init_archiver(settings)
         try:
             yield
         finally:
+            for task in backfills:
+                task.cancel()
+            await close_archiver()
+            await close_event_bus()
+            await close_usage_ledger()
             await dispose_engine()
 
     application = FastAPI(title=settings.app_name, lifespan=lifespan)
 
+    if settings.compression_enabled:
+        application.add_middleware(
+            CompressionMiddleware, **middleware_options(settings)
+        )
+    if settings.rate_limit_enabled:
+        # Shared with the WebSocket channel, whose frames bypass the middleware.
+        application.state.rate_limit_backend = backend_from_settings(settings)
+        application.state.rate_limits = limits_from_settings(settings)
+        application.add_middleware(
+            RateLimitMiddleware,
+            backend=application.state.rate_limit_backend,
+            limits=application.state.rate_limits,
+            secret_key=settings.secret_key,
+            proxy_hops=settings.rate_limit_proxy_hops,
+        )
+
     application.add_middleware(
         CORSMiddleware,
         allow_origins=settings.backend_cors_origins,
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[READ_AFTER_HEADER],
     )
 
     @application.get("/health")
     async def health_check() -> dict[str, str]:
         return {"status": "ok"}
 
+    @application.get(
+        "/health/storage", dependencies=[Depends(require_internal_token)]
+    )
+    async def storage_health(
+        session: AsyncSession = Depends(get_session),
+    ) -> dict[str, Any]:
+        return await storage_report(session)
+
     application.include_router(auth.router, prefix="/auth", tags=["auth"])
     application.include_router(profile.router, prefix="/profile", tags=["profile"])
     application.include_router(chats.router, prefix="/chats", tags=["chats"])
+    application.include_router(realtime.router, prefix="/chats", tags=["chats"])
 
     @application.get("/", include_in_schema=False)
     async def swagger_redirect() -> RedirectResponse:
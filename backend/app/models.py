@@ -3,9 +3,23 @@
 from __future__ import annotations
 
 import uuid
-from datetime import datetime
-
-from sqlalchemy import DateTime, ForeignKey, String, Text, func
+from datetime import date, datetime
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    func,
+    true,
+)
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from typing import Any
@@ -51,6 +65,7 @@ class Chat(TimestampMixin, Base):
     """A chat thread between the user and the assistant."""
 
     __tablename__ = "chats"
+    __table_args__ = (Index("ix_chats_user_id_updated_at", "user_id", "updated_at"),)
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
@@ -65,6 +80,29 @@ class Chat(TimestampMixin, Base):
     model_name: Mapped[str] = mapped_column(
         String(100), default="z-ai/glm-4.5-air:free", nullable=False
     )
+    # Denormalized from ``messages`` so the sidebar listing never joins it.
+    message_count: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    last_message_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    last_message_preview: Mapped[str | None] = mapped_column(
+        String(200), nullable=True
+    )
+    # Bumped by every write that changes the chat's messages; feeds its ETag.
+    version: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    # Set while the chat's messages live in ``archived_chats`` instead.
+    archived_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # Reading a chat rehydrates it without touching ``updated_at``; this
+    # keeps the archive job from moving it straight back.
+    rehydrated_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
 
     user: Mapped[User] = relationship(back_populates="chats")
     messages: Mapped[list["Message"]] = relationship(
@@ -91,9 +129,77 @@ class Message(Base):
     role: Mapped[str] = mapped_column(String(50), nullable=False)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     model_name: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    # Assistant replies point at the user turn they answer; regenerated
+    # alternatives are siblings of which exactly one is selected.
+    parent_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("messages.id", ondelete="CASCADE"),
+        index=True,
+        nullable=True,
+    )
+    selected: Mapped[bool] = mapped_column(
+        Boolean, default=True, server_default=true(), nullable=False
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
 
     chat: Mapped[Chat] = relationship(back_populates="messages")
 
+
+class ArchivedChat(Base):
+    """Cold copy of an idle chat's messages as gzip-compressed NDJSON."""
+
+    __tablename__ = "archived_chats"
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("chats.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Stored so the storage report never has to read the payloads.
+    payload_bytes: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    archived_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class UsageDaily(Base):
+    """Daily rollup of upstream token usage per user, chat and model."""
+
+    __tablename__ = "usage_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # No foreign key: usage history outlives deleted chats.
+    chat_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    model_name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    request_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    prompt_tokens: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    completion_tokens: Mapped[int] = mapped_column(
+        BigInteger, default=0, nullable=False
+    )
+    latency_ms: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    cached_prompt_tokens: Mapped[int] = mapped_column(
+        BigInteger, default=0, server_default="0", nullable=False
+    )
+
+
+class RateLimitBucket(Base):
+    """Token bucket state shared by workers using the database rate limiter."""
+
+    __tablename__ = "rate_limit_buckets"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    # Unix timestamp of the last refill; plain seconds keep the math portable.
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)
+    allowed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
@@ -0,0 +1,258 @@
+"""OpenRouter chat-completion client and prompt assembly."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import uuid
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+from sqlalchemy import case, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import Settings
+from .models import Message
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+REQUEST_TIMEOUT = 60.0
+
+
+_semaphore: asyncio.Semaphore | None = None
+
+
+def _upstream_slot(settings: Settings) -> asyncio.Semaphore:
+    """Return the per-worker semaphore bounding concurrent upstream calls."""
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.openrouter_max_concurrency)
+    return _semaphore
+
+
+class OpenRouterError(Exception):
+    """Raised when the upstream call fails or returns an unusable payload."""
+
+    def __init__(self, detail: str) -> None:
+        super().__init__(detail)
+        self.detail = detail
+
+
+@dataclass
+class StreamDelta:
+    """A piece of a streamed completion."""
+
+    content: str = ""
+    usage: dict[str, Any] | None = None
+
+
+def build_headers(settings: Settings) -> dict[str, str]:
+    """Return the request headers OpenRouter expects."""
+    headers = {
+        "Authorization": f"Bearer {settings.open_router_api_key}",
+        "Content-Type": "application/json",
+    }
+    if settings.app_name:
+        headers["X-Title"] = settings.app_name
+    if settings.backend_cors_origins:
+        headers["HTTP-Referer"] = settings.backend_cors_origins[0]
+    return headers
+
+
+def window_start(total: int, limit: int, block: int) -> int:
+    """Return the offset of the history window, aligned to ``block``."""
+    block = max(1, min(block, limit))
+    return math.ceil(max(0, total - limit) / block) * block
+
+
+def window_size(total: int, limit: int, block: int) -> int:
+    """Return how many of the newest ``total`` messages the window holds."""
+    return limit - (window_start(total, limit, block) - max(0, total - limit))
+
+
+async def load_history(
+    session: AsyncSession,
+    chat_id: uuid.UUID,
+    limit: int,
+    *,
+    total: int,
+    block: int = 1,
+    until: Message | None = None,
+    pending: Sequence[Message] = (),
+) -> list[Message]:
+    """Return up to ``limit`` recent selected messages of a chat, oldest first.
+
+    The window start is rounded up to a multiple of ``block``, so it only
+    moves every ``block`` messages. Between moves every request shares a
+    byte-identical prefix (system prompt plus the older turns), which is what
+    upstream prompt caches key on. The window therefore holds between
+    ``limit - block + 1`` and ``limit`` messages.
+
+    ``total`` is the number of selected messages the window is cut from,
+    normally taken from ``Chat.message_count``, so no count query is needed.
+    A stale value only shifts where the window starts.
+
+    With ``until``, history ends at that user message and excludes any reply
+    to it, which is what regenerating that turn needs.
+
+    ``pending`` messages are not stored yet. They count towards ``total``
+    and end the window, so a turn can build its prompt before inserting them.
+    """
+    conditions = [Message.chat_id == chat_id, Message.selected.is_(True)]
+    if until is not None:
+        conditions += [
+            Message.created_at <= until.created_at,
+            ~((Message.role == "assistant") & (Message.created_at == until.created_at)),
+        ]
+
+    result = await session.execute(
+        select(Message)
+        .where(*conditions)
+        # A turn's messages can share a timestamp; keep the user message first
+        # and break remaining ties by id so the order never changes.
+        .order_by(
+            Message.created_at.desc(),
+            case((Message.role == "user", 0), else_=1).desc(),
+            Message.id.desc(),
+        )
+        .limit(max(0, window_size(total, limit, block) - len(pending)))
+    )
+    return [*reversed(result.scalars().all()), *pending]
+
+
+def supports_cache_hints(settings: Settings, model: str) -> bool:
+    """Return True when ``model`` needs explicit ``cache_control`` breakpoints."""
+    return any(
+        model.startswith(prefix) for prefix in settings.prompt_cache_model_prefixes
+    )
+
+
+def _cached_text(text: str) -> list[dict[str, Any]]:
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def build_messages(
+    settings: Settings, history: Sequence[Message], model: str
+) -> list[dict[str, Any]]:
+    """Assemble the system prompt and history into the upstream payload.
+
+    Providers that cache prompts automatically (OpenAI-style) only need the
+    stable ordering. For models that take explicit hints, breakpoints are set
+    after the system prompt and after the last message of earlier turns.
+    """
+    messages: list[dict[str, Any]] = [
+        {"role": "system", "content": settings.system_prompt},
+        *(
+            {"role": message.role, "content": message.content}
+            for message in history
+        ),
+    ]
+    if supports_cache_hints(settings, model):
+        messages[0]["content"] = _cached_text(settings.system_prompt)
+        if len(messages) > 2:
+            messages[-2]["content"] = _cached_text(messages[-2]["content"])
+    return messages
+
+
+def _request_body(
+    settings: Settings,
+    model: str,
+    messages: list[dict[str, Any]],
+    temperature: float | None,
+) -> dict[str, Any]:
+    return {
+        "model": model,
+        "messages": messages,
+        "temperature": (
+            settings.openrouter_temperature if temperature is None else temperature
+        ),
+        # Detailed usage includes cached prompt token counts.
+        "usage": {"include": True},
+    }
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        detail = response.json()
+    except ValueError:
+        detail = response.text
+    return f"Upstream OpenRouter error: {detail}"
+
+
+async def complete(
+    settings: Settings,
+    model: str,
+    messages: list[dict[str, Any]],
+    *,
+    temperature: float | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """Run a completion and return the assistant text with the raw response."""
+    async with _upstream_slot(settings), httpx.AsyncClient(
+        timeout=REQUEST_TIMEOUT
+    ) as client:
+        response = await client.post(
+            OPENROUTER_URL,
+            headers=build_headers(settings),
+            json=_request_body(settings, model, messages, temperature),
+        )
+
+    if response.status_code >= 400:
+        raise OpenRouterError(_error_detail(response))
+
+    data = response.json()
+    try:
+        return data["choices"][0]["message"]["content"], data
+    except (KeyError, IndexError, TypeError) as exc:
+        raise OpenRouterError("Invalid response format from OpenRouter.") from exc
+
+
+async def stream_completion(
+    settings: Settings,
+    model: str,
+    messages: list[dict[str, Any]],
+    *,
+    temperature: float | None = None,
+) -> AsyncIterator[StreamDelta]:
+    """Yield content deltas as OpenRouter streams them; usage comes last.
+
+    The concurrency slot is held until the stream ends, so it bounds the
+    open upstream streams. Consumers must keep reading (or close the
+    generator) rather than wait on slow clients.
+    """
+    body = _request_body(settings, model, messages, temperature)
+    body["stream"] = True
+
+    async with _upstream_slot(settings), httpx.AsyncClient(
+        timeout=REQUEST_TIMEOUT
+    ) as client, client.stream(
+        "POST", OPENROUTER_URL, headers=build_headers(settings), json=body
+    ) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            raise OpenRouterError(_error_detail(response))
+
+        async for line in response.aiter_lines():
+            # Lines starting with ":" are keep-alive comments.
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            try:
+                chunk = json.loads(payload)
+            except ValueError as exc:
+                raise OpenRouterError(
+                    "Invalid response format from OpenRouter."
+                ) from exc
+            if "error" in chunk:
+                raise OpenRouterError(
+                    f"Upstream OpenRouter error: {chunk['error']}"
+                )
+            choices = chunk.get("choices") or [{}]
+            content = (choices[0].get("delta") or {}).get("content") or ""
+            usage = chunk.get("usage")
+            if content or usage:
+                yield StreamDelta(content=content, usage=usage)
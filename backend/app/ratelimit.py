@@ -0,0 +1,253 @@
+"""Token-bucket rate limiting for API route groups."""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Protocol
+
+from jose import JWTError, jwt
+from sqlalchemy import case, delete
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import database
+from .auth import ALGORITHM
+from .config import Settings
+from .models import RateLimitBucket
+
+PERIODS = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
+PRUNE_INTERVAL_SECONDS = 300.0
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Allow ``capacity`` requests per ``period`` seconds, refilled smoothly."""
+
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> RateLimit:
+        """Parse limits written as ``"<count>/<second|minute|hour|day>"``."""
+        try:
+            count, unit = value.split("/", 1)
+            capacity = int(count)
+            period = PERIODS[unit.strip().lower().rstrip("s")]
+        except (KeyError, ValueError) as exc:
+            raise ValueError(f"Invalid rate limit: {value!r}") from exc
+        if capacity < 1:
+            raise ValueError(f"Invalid rate limit: {value!r}")
+        return cls(capacity=capacity, period=period)
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    """Outcome of consuming one token from a bucket."""
+
+    allowed: bool
+    retry_after: float = 0.0
+
+
+class RateLimitBackend(Protocol):
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitDecision: ...
+
+
+class MemoryBackend:
+    """Per-process token buckets; suitable for a single worker.
+
+    Buckets are kept in least-recently-used order and only the oldest are
+    evicted when ``max_keys`` is reached, so flooding the limiter with new
+    keys cannot reset the buckets of active clients.
+    """
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitDecision:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            while len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            self._buckets[key] = [limit.capacity - 1.0, now]
+            return RateLimitDecision(True)
+
+        self._buckets.move_to_end(key)
+        tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return RateLimitDecision(True)
+        bucket[0] = tokens
+        return RateLimitDecision(False, (1.0 - tokens) / limit.rate)
+
+
+class DatabaseBackend:
+    """Token buckets stored in the database, shared by all workers.
+
+    Each hit is a single atomic ``INSERT ... ON CONFLICT DO UPDATE ...
+    RETURNING`` so concurrent workers never race on the same bucket. Every
+    few minutes a hit also deletes buckets idle for longer than ``idle_after``
+    seconds; by then they have refilled and carry no state.
+    """
+
+    def __init__(self, idle_after: float = PERIODS["day"]) -> None:
+        self.idle_after = idle_after
+        self._pruned_at = 0.0
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitDecision:
+        if database.SessionLocal is None:
+            return RateLimitDecision(True)
+
+        now = time.time()
+        table = RateLimitBucket.__table__
+        async with database.SessionLocal() as session:
+            statement = database.upsert_statement(
+                session.get_bind().dialect.name, table
+            ).values(key=key, tokens=limit.capacity - 1.0, updated_at=now, allowed=True)
+            refilled = table.c.tokens + (
+                statement.excluded.updated_at - table.c.updated_at
+            ) * limit.rate
+            capped = case(
+                (refilled > limit.capacity, float(limit.capacity)), else_=refilled
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={
+                    "tokens": case((capped >= 1.0, capped - 1.0), else_=capped),
+                    "allowed": capped >= 1.0,
+                    "updated_at": statement.excluded.updated_at,
+                },
+            ).returning(table.c.tokens, table.c.allowed)
+            result = await session.execute(statement)
+            tokens, allowed = result.one()
+            if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                self._pruned_at = now
+                await session.execute(
+                    delete(RateLimitBucket).where(
+                        RateLimitBucket.updated_at < now - self.idle_after
+                    )
+                )
+            await session.commit()
+
+        if allowed:
+            return RateLimitDecision(True)
+        return RateLimitDecision(False, (1.0 - tokens) / limit.rate)
+
+
+def route_group(method: str, path: str) -> str | None:
+    """Map a request to the rate-limit group it belongs to."""
+    path = path.rstrip("/")
+    if method == "POST" and path in {"/auth/login", "/auth/register"}:
+        return "auth"
+    if path.startswith("/chats/"):
+        if method == "POST" and path.endswith(("/messages", "/regenerate")):
+            return "send"
+        if method == "GET":
+            return "read"
+    if method == "GET" and (path == "/chats" or path.startswith("/profile")):
+        return "read"
+    return None
+
+
+def limits_from_settings(settings: Settings) -> dict[str, RateLimit]:
+    """Build the per-group limits configured in ``settings``."""
+    return {
+        "auth": RateLimit.parse(settings.rate_limit_auth),
+        "read": RateLimit.parse(settings.rate_limit_reads),
+        "send": RateLimit.parse(settings.rate_limit_sends),
+    }
+
+
+def backend_from_settings(settings: Settings) -> RateLimitBackend:
+    """Instantiate the configured rate-limit backend."""
+    if settings.rate_limit_backend == "memory":
+        return MemoryBackend()
+    if settings.rate_limit_backend == "database":
+        longest = max(limit.period for limit in limits_from_settings(settings).values())
+        return DatabaseBackend(idle_after=longest)
+    raise ValueError(f"Unknown rate limit backend: {settings.rate_limit_backend!r}")
+
+
+class RateLimitMiddleware:
+    """ASGI middleware that answers ``429`` once a client's bucket is empty.
+
+    Authenticated requests are keyed by the JWT subject (decoded without a
+    database lookup); anonymous requests and the auth endpoints by client IP.
+    Behind ``proxy_hops`` trusted proxies the client IP is the entry those
+    proxies appended to ``X-Forwarded-For``; entries further left are
+    client-controlled and ignored.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        backend: RateLimitBackend,
+        limits: dict[str, RateLimit],
+        secret_key: str,
+        proxy_hops: int = 0,
+    ) -> None:
+        self.app = app
+        self.backend = backend
+        self.limits = limits
+        self.secret_key = secret_key
+        self.proxy_hops = proxy_hops
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        group = route_group(scope["method"], scope["path"])
+        limit = self.limits.get(group) if group else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        identity = None if group == "auth" else self._user_id(headers)
+        key = f"{group}:" + (
+            f"user:{identity}" if identity else f"ip:{self._client_ip(scope, headers)}"
+        )
+
+        decision = await self.backend.hit(key, limit)
+        if decision.allowed:
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            {"detail": "Too many requests."},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+        )
+        await response(scope, receive, send)
+
+    def _user_id(self, headers: dict[bytes, bytes]) -> str | None:
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        subject = payload.get("sub")
+        return str(subject) if subject else None
+
+    def _client_ip(self, scope: Scope, headers: dict[bytes, bytes]) -> str:
+        if self.proxy_hops > 0:
+            forwarded = headers.get(b"x-forwarded-for", b"").decode("latin-1")
+            hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+            if len(hops) >= self.proxy_hops:
+                return hops[-self.proxy_hops]
+        client = scope.get("client")
+        return client[0] if client else "unknown"
@@ -0,0 +1,383 @@
+"""Regenerating a chat turn with several concurrent candidate replies.
+
+The first candidate to answer becomes the selected reply. The others keep
+running in the background and are stored as unselected siblings sharing the
+same parent user message, so the user can switch to one of them later.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from . import database, events, openrouter, summaries
+from .config import Settings
+from .events import Event, EventBus
+from .models import Chat, Message
+from .schemas import RegenerateRequest
+from .usage import UsageLedger, parse_usage
+
+logger = logging.getLogger(__name__)
+
+LINK_BATCH_SIZE = 500
+
+# Keeps background tasks referenced until they finish.
+_background_tasks: set[asyncio.Task[None]] = set()
+
+
+@dataclass
+class Candidate:
+    """A completed alternative reply for a regenerated turn."""
+
+    model_name: str
+    content: str
+    data: dict[str, Any]
+    latency_ms: int
+
+
+def candidate_options(
+    payload: RegenerateRequest, default_model: str, settings: Settings
+) -> list[tuple[str, float]]:
+    """Return ``(model, temperature)`` per candidate, cycling through the lists."""
+    return [
+        (
+            payload.models[index % len(payload.models)]
+            if payload.models
+            else default_model,
+            payload.temperatures[index % len(payload.temperatures)]
+            if payload.temperatures
+            else settings.openrouter_temperature,
+        )
+        for index in range(payload.candidates)
+    ]
+
+
+async def last_user_message(
+    session: AsyncSession, chat_id: uuid.UUID
+) -> Message | None:
+    """Return the user message whose reply a regeneration replaces."""
+    result = await session.execute(
+        select(Message)
+        .where(
+            Message.chat_id == chat_id,
+            Message.role == "user",
+            Message.selected.is_(True),
+        )
+        .order_by(Message.created_at.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def history_total(
+    session: AsyncSession, chat: Chat, anchor: Message
+) -> int:
+    """Return how many selected messages a regeneration's history is cut from.
+
+    That is the chat's counter minus the reply being replaced, found through
+    the parent index rather than by counting the whole chat.
+    """
+    replies = await session.scalar(
+        select(func.count(Message.id)).where(
+            Message.parent_id == anchor.id, Message.selected.is_(True)
+        )
+    )
+    return chat.message_count - (replies or 0)
+
+
+async def link_orphan_replies(batch_size: int = LINK_BATCH_SIZE) -> int:
+    """Give replies stored before parent links the nearest preceding user message.
+
+    Without a parent an unselected reply can never be selected again. Walks
+    orphaned replies by primary key, one short transaction per batch, so it
+    can run against a live database; replies with no earlier user message
+    stay unlinked. Returns the number of replies linked.
+    """
+    if database.SessionLocal is None:
+        raise RuntimeError("Database engine has not been initialised.")
+
+    turn = aliased(Message)
+    nearest_turn = (
+        select(turn.id)
+        .where(
+            turn.chat_id == Message.chat_id,
+            turn.role == "user",
+            turn.created_at <= Message.created_at,
+        )
+        .order_by(turn.created_at.desc(), turn.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    linked = 0
+    last_id: uuid.UUID | None = None
+    while True:
+        async with database.SessionLocal() as session:
+            statement = (
+                select(Message.id)
+                .where(Message.role == "assistant", Message.parent_id.is_(None))
+                .order_by(Message.id)
+                .limit(batch_size)
+            )
+            if last_id is not None:
+                statement = statement.where(Message.id > last_id)
+            reply_ids = list((await session.execute(statement)).scalars().all())
+            if not reply_ids:
+                return linked
+            result = await session.execute(
+                update(Message)
+                .where(Message.id.in_(reply_ids), nearest_turn.is_not(None))
+                .values(parent_id=nearest_turn)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        linked += result.rowcount or 0
+        last_id = reply_ids[-1]
+
+
+async def run_candidate(
+    settings: Settings,
+    model_name: str,
+    temperature: float,
+    messages_payload: list[dict[str, Any]],
+) -> Candidate:
+    """Run one non-streamed candidate completion."""
+    started = time.perf_counter()
+    content, data = await openrouter.complete(
+        settings, model_name, messages_payload, temperature=temperature
+    )
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    return Candidate(model_name, content, data, latency_ms)
+
+
+def record_usage(
+    ledger: UsageLedger, user_id: uuid.UUID, chat_id: uuid.UUID, candidate: Candidate
+) -> None:
+    prompt_tokens, completion_tokens, cached_tokens = parse_usage(candidate.data)
+    ledger.record(
+        user_id=user_id,
+        chat_id=chat_id,
+        model_name=candidate.model_name,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency_ms=candidate.latency_ms,
+        cached_prompt_tokens=cached_tokens,
+    )
+
+
+async def select_reply(
+    session: AsyncSession, chat: Chat, anchor: Message, candidate: Candidate
+) -> Message:
+    """Store ``candidate`` as the selected reply to ``anchor``; the caller commits.
+
+    The reply it replaces is linked to ``anchor`` if it predates parent
+    links, so it can still be selected again afterwards.
+    """
+    deselected = await session.execute(
+        update(Message)
+        .where(
+            Message.chat_id == chat.id,
+            Message.role == "assistant",
+            Message.selected.is_(True),
+            Message.created_at >= anchor.created_at,
+        )
+        .values(selected=False, parent_id=func.coalesce(Message.parent_id, anchor.id))
+        .execution_options(synchronize_session=False)
+    )
+    message = Message(
+        chat_id=chat.id,
+        role="assistant",
+        content=candidate.content,
+        model_name=candidate.model_name,
+        parent_id=anchor.id,
+    )
+    session.add(message)
+    summaries.record_messages(chat, [message], replaced=deselected.rowcount or 0)
+    session.add(chat)
+    return message
+
+
+async def store_alternatives(
+    user_id: uuid.UUID,
+    chat_id: uuid.UUID,
+    parent_id: uuid.UUID,
+    finished: Sequence[Candidate],
+    pending: Iterable[asyncio.Task[Candidate]],
+    ledger: UsageLedger,
+    bus: EventBus,
+) -> None:
+    """Wait for the remaining candidates and store them as unselected siblings.
+
+    Usage of ``finished`` candidates is expected to be recorded already.
+    """
+    candidates = list(finished)
+    for next_done in asyncio.as_completed(list(pending)):
+        try:
+            candidate = await next_done
+        except (openrouter.OpenRouterError, httpx.HTTPError) as exc:
+            logger.info("Discarding failed regeneration candidate: %s", exc)
+            continue
+        record_usage(ledger, user_id, chat_id, candidate)
+        candidates.append(candidate)
+    if not candidates or database.SessionLocal is None:
+        return
+
+    alternatives = [
+        Message(
+            chat_id=chat_id,
+            role="assistant",
+            content=candidate.content,
+            model_name=candidate.model_name,
+            parent_id=parent_id,
+            selected=False,
+        )
+        for candidate in candidates
+    ]
+    async with database.SessionLocal() as session:
+        session.add_all(alternatives)
+        # Alternatives are part of the chat's detail, so its ETag must change.
+        await session.execute(
+            update(Chat)
+            .where(Chat.id == chat_id)
+            .values(version=Chat.version + 1, updated_at=Chat.updated_at)
+        )
+        try:
+            await session.commit()
+        except IntegrityError:
+            # The chat or turn was deleted while the candidates were running.
+            return
+
+    await bus.publish(
+        *(
+            Event(
+                events.MESSAGE_APPENDED,
+                user_id,
+                chat_id,
+                {
+                    "message_id": str(message.id),
+                    "role": message.role,
+                    "alternative": True,
+                },
+            )
+            for message in alternatives
+        )
+    )
+
+
+def store_alternatives_later(
+    user_id: uuid.UUID,
+    chat_id: uuid.UUID,
+    parent_id: uuid.UUID,
+    finished: Sequence[Candidate],
+    pending: Iterable[asyncio.Task[Candidate]],
+    ledger: UsageLedger,
+    bus: EventBus,
+) -> None:
+    """Run ``store_alternatives`` without making the caller wait for it."""
+    task = asyncio.create_task(
+        store_alternatives(
+            user_id, chat_id, parent_id, finished, pending, ledger, bus
+        )
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class StreamRace:
+    """Stream several candidates at once and forward only the first to answer.
+
+    The first candidate to produce text wins and from then on every delta
+    it reads is passed to ``forward``, which must not wait on the client:
+    each candidate holds an upstream slot until its stream ends. The other
+    candidates keep streaming silently.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        options: Sequence[tuple[str, float]],
+        messages_for: Callable[[str], list[dict[str, Any]]],
+        forward: Callable[[str], Awaitable[None]],
+    ) -> None:
+        self.settings = settings
+        self.forward = forward
+        self.winner: asyncio.Task[Candidate] | None = None
+        self._decided = asyncio.Event()
+        self._answered: asyncio.Queue[asyncio.Task[Candidate]] = asyncio.Queue()
+        self.tasks = [
+            asyncio.create_task(
+                self._stream(model_name, temperature, messages_for(model_name))
+            )
+            for model_name, temperature in options
+        ]
+
+    async def _stream(
+        self,
+        model_name: str,
+        temperature: float,
+        messages_payload: list[dict[str, Any]],
+    ) -> Candidate:
+        task = asyncio.current_task()
+        parts: list[str] = []
+        usage: dict[str, Any] | None = None
+        started = time.perf_counter()
+        stream = openrouter.stream_completion(
+            self.settings, model_name, messages_payload, temperature=temperature
+        )
+        async with contextlib.aclosing(stream):
+            async for delta in stream:
+                if delta.content:
+                    parts.append(delta.content)
+                    if not self._decided.is_set():
+                        self._answered.put_nowait(task)
+                        await self._decided.wait()
+                    if task is self.winner:
+                        await self.forward(delta.content)
+                if delta.usage:
+                    usage = delta.usage
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        return Candidate(model_name, "".join(parts), {"usage": usage}, latency_ms)
+
+    async def decide(self) -> asyncio.Task[Candidate]:
+        """Return the winning task; raise the first failure if every one failed.
+
+        A candidate that finishes without any text can win as well.
+        """
+        answered = asyncio.create_task(self._answered.get())
+        running = set(self.tasks)
+        try:
+            while running and self.winner is None:
+                done, _ = await asyncio.wait(
+                    {answered, *running}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if answered in done:
+                    self.winner = answered.result()
+                    break
+                for task in done:
+                    running.discard(task)
+                    if self.winner is None and task.exception() is None:
+                        self.winner = task
+        finally:
+            answered.cancel()
+            self._decided.set()
+        if self.winner is None:
+            raise next(task.exception() for task in self.tasks)
+        return self.winner
+
+    def losers(self) -> list[asyncio.Task[Candidate]]:
+        return [task for task in self.tasks if task is not self.winner]
+
+    def cancel(self) -> None:
+        for task in self.tasks:
+            task.cancel()
@@ -2,13 +2,14 @@
 
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import auth
 from ..config import Settings, get_settings
 from ..database import get_session
+from ..deps import issue_read_after
 from ..models import User
 from ..schemas import AuthResponse, LoginRequest, UserCreate, UserRead
 
@@ -23,7 +24,9 @@ router = APIRouter()
 )
 async def register_user(
     payload: UserCreate,
+    response: Response,
     session: AsyncSession = Depends(get_session),
+    settings: Settings = Depends(get_settings),
 ) -> User:
     """Create a new user if the email address is not already registered."""
     existing = await session.execute(select(User).where(User.email == payload.email))
@@ -39,8 +42,12 @@ async def register_user(
         display_name=payload.display_name,
     )
     session.add(user)
+    await session.flush()
+    # The new account is a write; keep the user's first reads on the primary.
+    session.info["user_id"] = user.id
     await session.commit()
     await session.refresh(user)
+    issue_read_after(response, user.id, settings)
     return user
 
 
@@ -51,6 +58,7 @@ async def register_user(
 )
 async def login_user(
     payload: LoginRequest,
+    response: Response,
     session: AsyncSession = Depends(get_session),
     settings: Settings = Depends(get_settings),
 ) -> AuthResponse:
@@ -69,5 +77,7 @@ async def login_user(
         )
 
     token = auth.create_access_token(subject=str(user.id), settings=settings)
+    # Replicas may still lag behind a recent registration.
+    issue_read_after(response, user.id, settings)
     return AuthResponse(access_token=token, token_type="bearer", user=user)
 
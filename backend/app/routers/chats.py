@@ -2,27 +2,57 @@
 
 from __future__ import annotations
 
+import asyncio
+import time
 import uuid
+import zlib
 from datetime import datetime, timezone
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy import select
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .. import (
+    archive,
+    events,
+    openrouter,
+    regeneration,
+    summaries,
+    transfer,
+)
 from ..config import Settings, get_settings
 from ..database import get_session
-from ..deps import get_current_user
+from ..deps import (
+    get_current_reader,
+    get_current_user,
+    get_read_session,
+)
+from ..etag import etag_matches, not_modified, set_etag, weak_etag
+from ..events import Event, EventBus, get_event_bus
 from ..models import Chat, Message, User
 from ..schemas import (
     ChatBase,
     ChatCreate,
     ChatDetail,
+    ChatImportResult,
     ChatUpdate,
     MessageCreate,
     MessageRead,
+    RegenerateRequest,
 )
+from ..usage import UsageLedger, get_usage_ledger, parse_usage
 
 router = APIRouter()
 
@@ -33,10 +63,14 @@ async def _get_chat_or_404(
     user: User,
     *,
     load_messages: bool = False,
+    include_alternatives: bool = False,
 ) -> Chat:
     statement = select(Chat).where(Chat.id == chat_id, Chat.user_id == user.id)
     if load_messages:
-        statement = statement.options(selectinload(Chat.messages))
+        relationship = Chat.messages
+        if not include_alternatives:
+            relationship = relationship.and_(Message.selected.is_(True))
+        statement = statement.options(selectinload(relationship))
 
     result = await session.execute(statement)
     chat = result.scalar_one_or_none()
@@ -48,15 +82,53 @@ async def _get_chat_or_404(
     return chat
 
 
+async def _chat_etag_or_404(
+    session: AsyncSession, chat_id: uuid.UUID, user: User, *variant: object
+) -> str:
+    """Derive a chat's ETag from its row without loading messages.
+
+    ``version`` is bumped by every write to the chat's messages, while
+    archiving and rehydrating leave it alone, so a revalidation of a cold
+    chat needs no rehydration.
+    """
+    result = await session.execute(
+        select(Chat.updated_at, Chat.version).where(
+            Chat.id == chat_id, Chat.user_id == user.id
+        )
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat not found.",
+        )
+    return weak_etag(chat_id, *row, *variant)
+
+
 @router.get(
     "/",
     response_model=list[ChatBase],
     summary="List chats for the current user",
 )
 async def list_chats(
-    current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
-) -> list[Chat]:
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+    current_user: User = Depends(get_current_reader),
+    session: AsyncSession = Depends(get_read_session),
+) -> list[Chat] | Response:
+    version = await session.execute(
+        select(
+            func.count(Chat.id),
+            func.max(Chat.updated_at),
+            # Summary repairs bump versions without touching ``updated_at``.
+            func.sum(Chat.version),
+        ).where(Chat.user_id == current_user.id)
+    )
+    etag = weak_etag(current_user.id, *version.one())
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
     result = await session.execute(
         select(Chat)
         .where(Chat.user_id == current_user.id)
@@ -76,6 +148,7 @@ async def create_chat(
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
     settings: Settings = Depends(get_settings),
+    bus: EventBus = Depends(get_event_bus),
 ) -> Chat:
     chat = Chat(
         user_id=current_user.id,
@@ -85,9 +158,109 @@ async def create_chat(
     session.add(chat)
     await session.commit()
     await session.refresh(chat)
+    await bus.publish(
+        Event(
+            events.CHAT_CREATED,
+            current_user.id,
+            chat.id,
+            {"title": chat.title, "model_name": chat.model_name},
+        )
+    )
     return chat
 
 
+@router.get(
+    "/events",
+    response_class=StreamingResponse,
+    summary="Stream live chat events for the current user",
+)
+async def stream_events(
+    current_user: User = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    bus: EventBus = Depends(get_event_bus),
+) -> StreamingResponse:
+    """Push bus events as Server-Sent Events, with periodic keep-alives."""
+    user_id = current_user.id
+    heartbeat = settings.event_stream_heartbeat_seconds
+
+    async def event_source():
+        async with bus.subscribe(user_id) as queue:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield f"event: {event.type}\ndata: {event.to_json()}\n\n".encode()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    summary="Export all chats and messages as NDJSON",
+)
+async def export_chats(
+    compress: bool = Query(default=False, alias="gzip"),
+    current_user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    """Stream every chat of the current user, one JSON record per line."""
+    headers = {
+        "Content-Disposition": (
+            f'attachment; filename="{transfer.export_filename(compress)}"'
+        )
+    }
+    return StreamingResponse(
+        transfer.iter_export_chunks(current_user.id, compress=compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers=headers,
+    )
+
+
+@router.post(
+    "/import",
+    response_model=ChatImportResult,
+    status_code=status.HTTP_201_CREATED,
+    summary="Import chats from an NDJSON export",
+)
+async def import_chats(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    settings: Settings = Depends(get_settings),
+    bus: EventBus = Depends(get_event_bus),
+) -> ChatImportResult:
+    """Ingest an export stream (plain or gzip) into new chats."""
+    compressed = (
+        request.headers.get("content-encoding", "").lower() == "gzip"
+        or request.headers.get("content-type", "").startswith("application/gzip")
+    )
+    records = transfer.iter_ndjson_records(request.stream(), compressed=compressed)
+    try:
+        chat_count, message_count = await transfer.import_records(
+            session,
+            current_user.id,
+            records,
+            default_model=settings.openrouter_model,
+        )
+    except (transfer.ImportFormatError, zlib.error) as exc:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid import file: {exc}",
+        ) from exc
+    await session.commit()
+    await bus.publish(
+        Event(events.CHATS_IMPORTED, current_user.id, data={"chats": chat_count})
+    )
+    return ChatImportResult(chats=chat_count, messages=message_count)
+
+
 @router.get(
     "/{chat_id}",
     response_model=ChatDetail,
@@ -95,13 +268,27 @@ async def create_chat(
 )
 async def get_chat(
     chat_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
-) -> Chat:
-    chat = await _get_chat_or_404(
-        session, chat_id, current_user, load_messages=True
+    response: Response,
+    include_alternatives: bool = Query(default=False),
+    if_none_match: str | None = Header(default=None),
+    current_user: User = Depends(get_current_reader),
+    session: AsyncSession = Depends(get_read_session),
+) -> Chat | Response:
+    etag = await _chat_etag_or_404(
+        session, chat_id, current_user, include_alternatives
     )
-    return chat
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    async with archive.hot_session(session, chat_id, current_user.id) as reader:
+        return await _get_chat_or_404(
+            reader,
+            chat_id,
+            current_user,
+            load_messages=True,
+            include_alternatives=include_alternatives,
+        )
 
 
 @router.patch(
@@ -114,12 +301,16 @@ async def rename_chat(
     payload: ChatUpdate,
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
+    bus: EventBus = Depends(get_event_bus),
 ) -> Chat:
     chat = await _get_chat_or_404(session, chat_id, current_user)
     chat.title = payload.title
     session.add(chat)
     await session.commit()
     await session.refresh(chat)
+    await bus.publish(
+        Event(events.CHAT_RENAMED, current_user.id, chat.id, {"title": chat.title})
+    )
     return chat
 
 
@@ -134,10 +325,12 @@ async def delete_chat(
     chat_id: uuid.UUID,
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
+    bus: EventBus = Depends(get_event_bus),
 ) -> None:
     chat = await _get_chat_or_404(session, chat_id, current_user)
     await session.delete(chat)
     await session.commit()
+    await bus.publish(Event(events.CHAT_DELETED, current_user.id, chat_id))
 
 
 @router.get(
@@ -147,17 +340,25 @@ async def delete_chat(
 )
 async def list_messages(
     chat_id: uuid.UUID,
-    current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
-) -> list[Message]:
-    await _get_chat_or_404(session, chat_id, current_user)
-
-    result = await session.execute(
-        select(Message)
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.created_at.asc())
+    response: Response,
+    include_alternatives: bool = Query(default=False),
+    if_none_match: str | None = Header(default=None),
+    current_user: User = Depends(get_current_reader),
+    session: AsyncSession = Depends(get_read_session),
+) -> list[Message] | Response:
+    etag = await _chat_etag_or_404(
+        session, chat_id, current_user, include_alternatives
     )
-    return list(result.scalars().all())
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    statement = select(Message).where(Message.chat_id == chat_id)
+    if not include_alternatives:
+        statement = statement.where(Message.selected.is_(True))
+    async with archive.hot_session(session, chat_id, current_user.id) as reader:
+        result = await reader.execute(statement.order_by(Message.created_at.asc()))
+        return list(result.scalars().all())
 
 
 @router.post(
@@ -172,6 +373,8 @@ async def send_message(
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
     settings: Settings = Depends(get_settings),
+    ledger: UsageLedger = Depends(get_usage_ledger),
+    bus: EventBus = Depends(get_event_bus),
 ) -> Message:
     chat = await _get_chat_or_404(session, chat_id, current_user)
 
@@ -181,6 +384,15 @@ async def send_message(
             detail="OpenRouter API key is not configured on the server.",
         )
 
+    if await ledger.quota_exceeded(session, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Daily token quota exceeded.",
+        )
+
+    if chat.archived_at is not None:
+        await archive.ensure_hot(chat.id, current_user.id)
+
     user_message = Message(
         chat_id=chat.id,
         role="user",
@@ -190,76 +402,254 @@ async def send_message(
     session.add(user_message)
     await session.flush()
 
-    history_result = await session.execute(
-        select(Message)
-        .where(Message.chat_id == chat.id)
-        .order_by(Message.created_at.desc())
-        .limit(settings.openrouter_max_history)
+    history = await openrouter.load_history(
+        session,
+        chat.id,
+        settings.openrouter_max_history,
+        # The new user message is not counted on the chat yet.
+        total=chat.message_count + 1,
+        block=settings.openrouter_history_block,
     )
-    history = list(history_result.scalars().all())
-    history.reverse()
-
-    messages_payload = [
-        {"role": "system", "content": settings.system_prompt},
-        *(
-            {"role": message.role, "content": message.content}
-            for message in history
-        ),
-    ]
-
-    request_body = {
-        "model": chat.model_name,
-        "messages": messages_payload,
-        "temperature": settings.openrouter_temperature,
-    }
+    messages_payload = openrouter.build_messages(settings, history, chat.model_name)
 
-    headers = {
-        "Authorization": f"Bearer {settings.open_router_api_key}",
-        "Content-Type": "application/json",
-    }
-    if settings.app_name:
-        headers["X-Title"] = settings.app_name
-    if settings.backend_cors_origins:
-        headers["HTTP-Referer"] = settings.backend_cors_origins[0]
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=request_body,
-        )
-
-    if response.status_code >= 400:
-        await session.rollback()
-        try:
-            detail = response.json()
-        except ValueError:
-            detail = response.text
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail=f"Upstream OpenRouter error: {detail}",
-        )
-
-    data = response.json()
+    await bus.publish(Event(events.GENERATION_STARTED, current_user.id, chat.id))
+    started = time.perf_counter()
     try:
-        assistant_content = data["choices"][0]["message"]["content"]
-    except (KeyError, IndexError) as exc:
+        assistant_content, data = await openrouter.complete(
+            settings, chat.model_name, messages_payload
+        )
+    except openrouter.OpenRouterError as exc:
+        # Rolling back expires the chat and the user, so publish first.
+        await bus.publish(Event(events.GENERATION_FAILED, current_user.id, chat.id))
         await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_502_BAD_GATEWAY,
-            detail="Invalid response format from OpenRouter.",
+            detail=exc.detail,
         ) from exc
+    latency_ms = int((time.perf_counter() - started) * 1000)
 
     assistant_message = Message(
         chat_id=chat.id,
         role="assistant",
         content=assistant_content,
         model_name=chat.model_name,
+        parent_id=user_message.id,
     )
     session.add(assistant_message)
-    chat.updated_at = datetime.now(timezone.utc)
+    summaries.record_messages(chat, [user_message, assistant_message])
     session.add(chat)
     await session.commit()
     await session.refresh(assistant_message)
+
+    prompt_tokens, completion_tokens, cached_tokens = parse_usage(data)
+    ledger.record(
+        user_id=current_user.id,
+        chat_id=chat.id,
+        model_name=chat.model_name,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency_ms=latency_ms,
+        cached_prompt_tokens=cached_tokens,
+    )
+    await bus.publish(
+        *events.turn_completed(
+            current_user.id, chat.id, [user_message, assistant_message]
+        )
+    )
     return assistant_message
 
+
+@router.post(
+    "/{chat_id}/regenerate",
+    response_model=MessageRead,
+    status_code=status.HTTP_201_CREATED,
+    summary="Regenerate the reply to the last user message",
+)
+async def regenerate_message(
+    chat_id: uuid.UUID,
+    payload: RegenerateRequest,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    settings: Settings = Depends(get_settings),
+    ledger: UsageLedger = Depends(get_usage_ledger),
+    bus: EventBus = Depends(get_event_bus),
+) -> Message:
+    """Re-run the last turn without adding another user message.
+
+    ``candidates`` completions run concurrently, cycling through the given
+    temperatures and models. The first one to finish becomes the selected
+    reply and is returned; the others are stored in the background as
+    unselected alternatives of the same user message.
+    """
+    chat = await _get_chat_or_404(session, chat_id, current_user)
+
+    if not settings.open_router_api_key:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="OpenRouter API key is not configured on the server.",
+        )
+
+    if await ledger.quota_exceeded(session, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Daily token quota exceeded.",
+        )
+
+    if chat.archived_at is not None:
+        await archive.ensure_hot(chat.id, current_user.id)
+
+    anchor = await regeneration.last_user_message(session, chat.id)
+    if anchor is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="There is no user message to regenerate a reply for.",
+        )
+
+    history = await openrouter.load_history(
+        session,
+        chat.id,
+        settings.openrouter_max_history,
+        total=await regeneration.history_total(session, chat, anchor),
+        block=settings.openrouter_history_block,
+        until=anchor,
+    )
+
+    await bus.publish(
+        Event(
+            events.GENERATION_STARTED,
+            current_user.id,
+            chat.id,
+            {"candidates": payload.candidates},
+        )
+    )
+    pending: set[asyncio.Task[regeneration.Candidate]] = {
+        asyncio.create_task(
+            regeneration.run_candidate(
+                settings,
+                model_name,
+                temperature,
+                openrouter.build_messages(settings, history, model_name),
+            )
+        )
+        for model_name, temperature in regeneration.candidate_options(
+            payload, chat.model_name, settings
+        )
+    }
+
+    winner: regeneration.Candidate | None = None
+    finished: list[regeneration.Candidate] = []
+    failures: list[BaseException] = []
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if error is not None:
+                    failures.append(error)
+                elif winner is None:
+                    winner = task.result()
+                else:
+                    finished.append(task.result())
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        raise
+
+    if winner is None:
+        # Rolling back expires the chat and the user, so publish first.
+        await bus.publish(Event(events.GENERATION_FAILED, current_user.id, chat.id))
+        await session.rollback()
+        error = failures[0]
+        if isinstance(error, openrouter.OpenRouterError):
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=error.detail,
+            ) from error
+        if isinstance(error, httpx.HTTPError):
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Could not reach OpenRouter.",
+            ) from error
+        raise error
+
+    assistant_message = await regeneration.select_reply(
+        session, chat, anchor, winner
+    )
+    await session.commit()
+    await session.refresh(assistant_message)
+
+    for candidate in (winner, *finished):
+        regeneration.record_usage(ledger, current_user.id, chat.id, candidate)
+    await bus.publish(
+        *events.turn_completed(current_user.id, chat.id, [assistant_message])
+    )
+
+    if finished or pending:
+        regeneration.store_alternatives_later(
+            current_user.id, chat.id, anchor.id, finished, pending, ledger, bus
+        )
+    return assistant_message
+
+
+@router.post(
+    "/{chat_id}/messages/{message_id}/select",
+    response_model=MessageRead,
+    summary="Select an alternative assistant reply",
+)
+async def select_alternative(
+    chat_id: uuid.UUID,
+    message_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    bus: EventBus = Depends(get_event_bus),
+) -> Message:
+    """Make ``message_id`` the reply used in history for its user turn."""
+    chat = await _get_chat_or_404(session, chat_id, current_user)
+    if chat.archived_at is not None:
+        await archive.ensure_hot(chat.id, current_user.id)
+    result = await session.execute(
+        select(Message).where(
+            Message.id == message_id,
+            Message.chat_id == chat.id,
+            Message.role == "assistant",
+        )
+    )
+    message = result.scalar_one_or_none()
+    if message is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found.",
+        )
+    if message.selected:
+        return message
+    if message.parent_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Message is not an alternative reply.",
+        )
+
+    await session.execute(
+        update(Message)
+        .where(Message.parent_id == message.parent_id, Message.id != message.id)
+        .values(selected=False)
+        .execution_options(synchronize_session=False)
+    )
+    message.selected = True
+    chat.updated_at = datetime.now(timezone.utc)
+    session.add_all([message, chat])
+    await session.flush()
+    await summaries.refresh_chat_summaries(session, [chat.id])
+    await session.commit()
+    await session.refresh(message)
+
+    await bus.publish(
+        Event(
+            events.MESSAGE_SELECTED,
+            current_user.id,
+            chat.id,
+            {"message_id": str(message.id), "parent_id": str(message.parent_id)},
+        )
+    )
+    return message
@@ -2,14 +2,18 @@
 
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import attributes
 
 from ..database import get_session
-from ..deps import get_current_user
-from ..models import User
-from ..schemas import UserRead, UserUpdate
+from ..deps import get_current_reader, get_current_user
+from ..models import UsageDaily, User
+from ..schemas import UsageDayRead, UsageReport, UserRead, UserUpdate
+from ..usage import UsageDelta, UsageLedger, get_usage_ledger
 
 router = APIRouter()
 
@@ -19,7 +23,7 @@ router = APIRouter()
     response_model=UserRead,
     summary="Fetch the current user's profile",
 )
-async def read_profile(current_user: User = Depends(get_current_user)) -> User:
+async def read_profile(current_user: User = Depends(get_current_reader)) -> User:
     """Return the authenticated user's profile information."""
     return current_user
 
@@ -51,3 +55,68 @@ async def update_profile(
     await session.refresh(current_user)
     return current_user
 
+
+@router.get(
+    "/usage",
+    response_model=UsageReport,
+    summary="Fetch the current user's token usage",
+)
+async def read_usage(
+    days: int = Query(default=30, ge=1, le=366),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    ledger: UsageLedger = Depends(get_usage_ledger),
+) -> UsageReport:
+    """Return daily usage per model from the rollup table and pending buffer."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    result = await session.execute(
+        select(
+            UsageDaily.day,
+            UsageDaily.model_name,
+            func.sum(UsageDaily.request_count),
+            func.sum(UsageDaily.prompt_tokens),
+            func.sum(UsageDaily.completion_tokens),
+            func.sum(UsageDaily.latency_ms),
+            func.sum(UsageDaily.cached_prompt_tokens),
+        )
+        .where(UsageDaily.user_id == current_user.id, UsageDaily.day >= since)
+        .group_by(UsageDaily.day, UsageDaily.model_name)
+    )
+
+    totals: dict[tuple[date, str], UsageDelta] = {}
+    for day, model_name, requests, prompt, completion, latency, cached in result.all():
+        totals[(day, model_name)] = UsageDelta(
+            int(requests), int(prompt), int(completion), int(latency), int(cached)
+        )
+    for (day, _, _, model_name), delta in ledger.pending_for_user(
+        current_user.id
+    ).items():
+        if day >= since:
+            totals.setdefault((day, model_name), UsageDelta()).add(delta)
+
+    usage_days = [
+        UsageDayRead(
+            day=day,
+            model_name=model_name,
+            request_count=delta.request_count,
+            prompt_tokens=delta.prompt_tokens,
+            completion_tokens=delta.completion_tokens,
+            cached_prompt_tokens=delta.cached_prompt_tokens,
+            prompt_cache_hit_rate=(
+                delta.cached_prompt_tokens / delta.prompt_tokens
+                if delta.prompt_tokens
+                else 0.0
+            ),
+            average_latency_ms=(
+                delta.latency_ms / delta.request_count if delta.request_count else 0.0
+            ),
+        )
+        for (day, model_name), delta in sorted(
+            totals.items(), key=lambda item: item[0], reverse=True
+        )
+    ]
+    return UsageReport(
+        daily_token_quota=ledger.daily_token_quota,
+        tokens_used_today=await ledger.tokens_used_today(session, current_user.id),
+        days=usage_days,
+    )
@@ -0,0 +1,622 @@
+"""WebSocket channel multiplexing live chat sessions over one connection."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import time
+import uuid
+from collections.abc import Awaitable
+from typing import Any
+
+import httpx
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from jose import JWTError
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import archive, database, events, openrouter, regeneration, summaries
+from ..auth import create_read_after_token, decode_access_token
+from ..config import Settings, get_settings
+from ..events import Event, EventBus, get_event_bus
+from ..models import Chat, Message, User
+from ..ratelimit import RateLimit, RateLimitBackend
+from ..schemas import MessageCreate, MessageRead, RegenerateRequest
+from ..usage import UsageLedger, get_usage_ledger, parse_usage
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class _ClientTooSlow(Exception):
+    """Raised when a generation's deltas no longer fit in the send queue."""
+
+
+class _ProgressPublisher:
+    """Publish a generation's text to the user's other tabs and workers.
+
+    Deltas are batched into at most one ``generation.progress`` event per
+    ``interval`` seconds. Each event carries the text added since the last
+    one and its character ``offset`` in the reply, so a late subscriber
+    knows what it missed.
+    """
+
+    def __init__(
+        self, bus: EventBus, user_id: uuid.UUID, chat_id: uuid.UUID, interval: float
+    ) -> None:
+        self.bus = bus
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.interval = interval
+        self.offset = 0
+        self.pending: list[str] = []
+        self.published_at = time.monotonic()
+
+    async def add(self, content: str) -> None:
+        self.pending.append(content)
+        if time.monotonic() - self.published_at >= self.interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending.clear()
+        self.published_at = time.monotonic()
+        await self.bus.publish(
+            Event(
+                events.GENERATION_PROGRESS,
+                self.user_id,
+                self.chat_id,
+                {"offset": self.offset, "content": text},
+            )
+        )
+        self.offset += len(text)
+
+
+class ChatConnection:
+    """State and tasks for one authenticated WebSocket.
+
+    All outgoing frames go through a bounded queue drained by a single
+    sender task. Deltas never wait for space in that queue: a generation
+    whose client falls a whole queue behind is aborted, so a stalled socket
+    cannot hold an upstream stream open.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user: User,
+        settings: Settings,
+        bus: EventBus,
+        ledger: UsageLedger,
+        *,
+        rate_limit_backend: RateLimitBackend | None = None,
+        send_limit: RateLimit | None = None,
+    ) -> None:
+        self.websocket = websocket
+        self.user_id = user.id
+        self.settings = settings
+        self.bus = bus
+        self.ledger = ledger
+        self.rate_limit_backend = rate_limit_backend
+        self.send_limit = send_limit
+        self.outbox: asyncio.Queue[dict[str, Any]] = asyncio.Queue(
+            maxsize=settings.ws_send_queue_size
+        )
+        self.generations: dict[uuid.UUID, asyncio.Task[None]] = {}
+        # Chats whose GENERATION_STARTED still awaits a terminal event.
+        self.in_flight: set[uuid.UUID] = set()
+        self.last_activity = time.monotonic()
+
+    async def run(self) -> None:
+        tasks = [
+            asyncio.create_task(self._sender()),
+            asyncio.create_task(self._receiver()),
+            asyncio.create_task(self._forward_events()),
+            asyncio.create_task(self._heartbeat()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (*tasks, *self.generations.values()):
+                task.cancel()
+            await asyncio.gather(
+                *tasks, *self.generations.values(), return_exceptions=True
+            )
+
+    async def send(self, frame: dict[str, Any]) -> None:
+        await self.outbox.put(frame)
+
+    def send_delta(self, chat_id: uuid.UUID, content: str) -> None:
+        try:
+            self.outbox.put_nowait(
+                {"type": "delta", "chat_id": chat_id, "content": content}
+            )
+        except asyncio.QueueFull:
+            raise _ClientTooSlow from None
+
+    async def _sender(self) -> None:
+        while True:
+            frame = await self.outbox.get()
+            await self.websocket.send_text(json.dumps(frame, default=str))
+
+    async def _receiver(self) -> None:
+        while True:
+            try:
+                frame = await self.websocket.receive_json()
+            except WebSocketDisconnect:
+                return
+            except ValueError:
+                await self.send({"type": "error", "detail": "Frames must be JSON."})
+                continue
+            self.last_activity = time.monotonic()
+            await self._dispatch(frame)
+
+    async def _dispatch(self, frame: Any) -> None:
+        kind = frame.get("type") if isinstance(frame, dict) else None
+        if kind == "ping":
+            await self.send({"type": "pong"})
+        elif kind == "pong":
+            return
+        elif kind in ("send", "regenerate"):
+            await self._start_generation(frame)
+        elif kind == "cancel":
+            await self._cancel_generation(frame)
+        else:
+            await self.send({"type": "error", "detail": f"Unknown frame type: {kind!r}"})
+
+    async def _forward_events(self) -> None:
+        async with self.bus.subscribe(self.user_id) as queue:
+            while True:
+                event = await queue.get()
+                # This socket already receives its own generations as deltas.
+                if (
+                    event.type == events.GENERATION_PROGRESS
+                    and event.chat_id in self.generations
+                ):
+                    continue
+                await self.send({"type": "event", "event": event.to_dict()})
+
+    async def _heartbeat(self) -> None:
+        interval = self.settings.ws_heartbeat_seconds
+        while True:
+            await asyncio.sleep(interval)
+            idle_for = time.monotonic() - self.last_activity
+            if not self.generations and idle_for > self.settings.ws_idle_timeout_seconds:
+                await self.websocket.close(
+                    code=status.WS_1000_NORMAL_CLOSURE, reason="Idle timeout"
+                )
+                return
+            await self.send({"type": "ping"})
+
+    @staticmethod
+    def _chat_id(frame: dict[str, Any]) -> uuid.UUID | None:
+        try:
+            return uuid.UUID(str(frame.get("chat_id")))
+        except ValueError:
+            return None
+
+    async def _start_generation(self, frame: dict[str, Any]) -> None:
+        chat_id = self._chat_id(frame)
+        if chat_id is None:
+            await self.send({"type": "error", "detail": "Invalid chat_id."})
+            return
+        payload: MessageCreate | RegenerateRequest
+        try:
+            if frame["type"] == "regenerate":
+                payload = RegenerateRequest(
+                    candidates=frame.get("candidates", 1),
+                    temperatures=frame.get("temperatures"),
+                    models=frame.get("models"),
+                )
+            else:
+                payload = MessageCreate(content=frame.get("content"))
+        except ValidationError:
+            detail = (
+                "Invalid regenerate options."
+                if frame["type"] == "regenerate"
+                else "Invalid content."
+            )
+            await self.send({"type": "error", "chat_id": chat_id, "detail": detail})
+            return
+        if chat_id in self.generations:
+            await self.send(
+                {
+                    "type": "error",
+                    "chat_id": chat_id,
+                    "detail": "A response is already being generated for this chat.",
+                }
+            )
+            return
+        if len(self.generations) >= self.settings.ws_max_active_generations:
+            await self.send(
+                {
+                    "type": "error",
+                    "chat_id": chat_id,
+                    "detail": "Too many concurrent generations on this connection.",
+                }
+            )
+            return
+        if not await self._allow_send(chat_id):
+            return
+
+        turn = (
+            self._regenerate_turn(chat_id, payload)
+            if isinstance(payload, RegenerateRequest)
+            else self._turn(chat_id, payload.content)
+        )
+        task = asyncio.create_task(self._generate(chat_id, turn))
+        self.generations[chat_id] = task
+        task.add_done_callback(lambda _: self.generations.pop(chat_id, None))
+
+    async def _allow_send(self, chat_id: uuid.UUID) -> bool:
+        """Apply the HTTP ``send`` rate limit, sharing the user's bucket."""
+        if self.rate_limit_backend is None or self.send_limit is None:
+            return True
+        decision = await self.rate_limit_backend.hit(
+            f"send:user:{self.user_id}", self.send_limit
+        )
+        if decision.allowed:
+            return True
+        await self.send(
+            {
+                "type": "error",
+                "chat_id": chat_id,
+                "detail": "Too many requests.",
+                "retry_after": max(1, math.ceil(decision.retry_after)),
+            }
+        )
+        return False
+
+    async def _cancel_generation(self, frame: dict[str, Any]) -> None:
+        chat_id = self._chat_id(frame)
+        task = self.generations.get(chat_id) if chat_id else None
+        if task is None:
+            await self.send(
+                {"type": "error", "chat_id": chat_id, "detail": "Nothing to cancel."}
+            )
+            return
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        await self.send({"type": "cancelled", "chat_id": chat_id})
+
+    async def _generate(self, chat_id: uuid.UUID, turn: Awaitable[None]) -> None:
+        """Run one chat turn; the client and the bus always learn how it ended."""
+        terminal = events.GENERATION_FAILED
+        try:
+            await turn
+        except asyncio.CancelledError:
+            terminal = events.GENERATION_CANCELLED
+            raise
+        except _ClientTooSlow:
+            await self.send(
+                {
+                    "type": "error",
+                    "chat_id": chat_id,
+                    "detail": "Client is not reading fast enough.",
+                }
+            )
+        except Exception:
+            logger.exception("Generation for chat %s failed", chat_id)
+            await self.send(
+                {
+                    "type": "error",
+                    "chat_id": chat_id,
+                    "detail": "Could not generate a response.",
+                }
+            )
+        finally:
+            if chat_id in self.in_flight:
+                self.in_flight.discard(chat_id)
+                await self.bus.publish(Event(terminal, self.user_id, chat_id))
+
+    async def _load_chat(
+        self, session: AsyncSession, chat_id: uuid.UUID
+    ) -> Chat | None:
+        """Return a hot chat of the user, or report why a turn cannot start."""
+        chat = (
+            await session.execute(
+                select(Chat).where(Chat.id == chat_id, Chat.user_id == self.user_id)
+            )
+        ).scalar_one_or_none()
+        if chat is None:
+            await self.send(
+                {"type": "error", "chat_id": chat_id, "detail": "Chat not found."}
+            )
+            return None
+        if await self.ledger.quota_exceeded(session, self.user_id):
+            await self.send(
+                {
+                    "type": "error",
+                    "chat_id": chat_id,
+                    "detail": "Daily token quota exceeded.",
+                }
+            )
+            return None
+        if chat.archived_at is not None:
+            await archive.ensure_hot(chat.id, self.user_id)
+        return chat
+
+    async def _send_done(self, chat_id: uuid.UUID, **messages: Message) -> None:
+        frame: dict[str, Any] = {"type": "done", "chat_id": chat_id}
+        for key, message in messages.items():
+            frame[key] = MessageRead.model_validate(message).model_dump(mode="json")
+        if self.settings.database_replica_urls:
+            # Same pin the HTTP API returns in ``X-Read-After``.
+            frame["read_after"] = create_read_after_token(self.user_id, self.settings)
+        await self.send(frame)
+
+    async def _stored_chat(
+        self, session: AsyncSession, chat_id: uuid.UUID
+    ) -> Chat | None:
+        """Return the chat a finished turn is stored in, unless it was deleted."""
+        chat = await session.get(Chat, chat_id)
+        if chat is None:
+            await self.send(
+                {"type": "error", "chat_id": chat_id, "detail": "Chat not found."}
+            )
+        return chat
+
+    async def _turn(self, chat_id: uuid.UUID, content: str) -> None:
+        """Stream one reply; nothing is stored unless it completes.
+
+        No session is held while streaming: the prompt is built first and
+        the turn is stored in a short transaction once the reply is done.
+        """
+        settings = self.settings
+        user_message = Message(
+            chat_id=chat_id, role="user", content=content, model_name=None
+        )
+        async with database.SessionLocal() as session:
+            chat = await self._load_chat(session, chat_id)
+            if chat is None:
+                return
+            history = await openrouter.load_history(
+                session,
+                chat.id,
+                settings.openrouter_max_history,
+                # The new user message is not counted on the chat yet.
+                total=chat.message_count + 1,
+                block=settings.openrouter_history_block,
+                pending=[user_message],
+            )
+        model_name = chat.model_name
+        messages_payload = openrouter.build_messages(settings, history, model_name)
+
+        await self.bus.publish(Event(events.GENERATION_STARTED, self.user_id, chat_id))
+        self.in_flight.add(chat_id)
+        parts: list[str] = []
+        usage: dict[str, Any] | None = None
+        progress = _ProgressPublisher(
+            self.bus, self.user_id, chat_id, settings.event_progress_seconds
+        )
+        started = time.perf_counter()
+        stream = openrouter.stream_completion(settings, model_name, messages_payload)
+        try:
+            # Closing the stream at once frees its upstream slot on any exit.
+            async with contextlib.aclosing(stream):
+                async for delta in stream:
+                    if delta.content:
+                        parts.append(delta.content)
+                        self.send_delta(chat_id, delta.content)
+                        await progress.add(delta.content)
+                    if delta.usage:
+                        usage = delta.usage
+        except (openrouter.OpenRouterError, httpx.HTTPError) as exc:
+            detail = (
+                exc.detail
+                if isinstance(exc, openrouter.OpenRouterError)
+                else "Could not reach OpenRouter."
+            )
+            await self.send({"type": "error", "chat_id": chat_id, "detail": detail})
+            return
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        await progress.flush()
+
+        prompt_tokens, completion_tokens, cached_tokens = parse_usage({"usage": usage})
+        self.ledger.record(
+            user_id=self.user_id,
+            chat_id=chat_id,
+            model_name=model_name,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=latency_ms,
+            cached_prompt_tokens=cached_tokens,
+        )
+
+        async with database.SessionLocal() as session:
+            session.info["user_id"] = self.user_id
+            chat = await self._stored_chat(session, chat_id)
+            if chat is None:
+                return
+            session.add(user_message)
+            await session.flush()
+            assistant_message = Message(
+                chat_id=chat.id,
+                role="assistant",
+                content="".join(parts),
+                model_name=model_name,
+                parent_id=user_message.id,
+            )
+            session.add(assistant_message)
+            summaries.record_messages(chat, [user_message, assistant_message])
+            await session.commit()
+            await session.refresh(user_message)
+            await session.refresh(assistant_message)
+
+        self.in_flight.discard(chat_id)
+        await self.bus.publish(
+            *events.turn_completed(
+                self.user_id, chat_id, [user_message, assistant_message]
+            )
+        )
+        await self._send_done(
+            chat_id, user_message=user_message, message=assistant_message
+        )
+
+    async def _regenerate_turn(
+        self, chat_id: uuid.UUID, options: RegenerateRequest
+    ) -> None:
+        """Race candidate replies to the last turn and stream the first to answer.
+
+        The winner replaces the selected reply once it completes, in a short
+        transaction like ``_turn``; the other candidates are stored in the
+        background as alternatives.
+        """
+        settings = self.settings
+        async with database.SessionLocal() as session:
+            chat = await self._load_chat(session, chat_id)
+            if chat is None:
+                return
+            anchor = await regeneration.last_user_message(session, chat.id)
+            if anchor is None:
+                await self.send(
+                    {
+                        "type": "error",
+                        "chat_id": chat_id,
+                        "detail": "There is no user message to regenerate a reply for.",
+                    }
+                )
+                return
+
+            history = await openrouter.load_history(
+                session,
+                chat.id,
+                settings.openrouter_max_history,
+                total=await regeneration.history_total(session, chat, anchor),
+                block=settings.openrouter_history_block,
+                until=anchor,
+            )
+
+        await self.bus.publish(
+            Event(
+                events.GENERATION_STARTED,
+                self.user_id,
+                chat_id,
+                {"candidates": options.candidates},
+            )
+        )
+        self.in_flight.add(chat_id)
+        progress = _ProgressPublisher(
+            self.bus, self.user_id, chat_id, settings.event_progress_seconds
+        )
+
+        async def forward(content: str) -> None:
+            self.send_delta(chat_id, content)
+            await progress.add(content)
+
+        race = regeneration.StreamRace(
+            settings,
+            regeneration.candidate_options(options, chat.model_name, settings),
+            lambda model_name: openrouter.build_messages(settings, history, model_name),
+            forward,
+        )
+        try:
+            winner = await (await race.decide())
+        except (openrouter.OpenRouterError, httpx.HTTPError) as exc:
+            race.cancel()
+            detail = (
+                exc.detail
+                if isinstance(exc, openrouter.OpenRouterError)
+                else "Could not reach OpenRouter."
+            )
+            await self.send({"type": "error", "chat_id": chat_id, "detail": detail})
+            return
+        except BaseException:
+            race.cancel()
+            raise
+        await progress.flush()
+        regeneration.record_usage(self.ledger, self.user_id, chat_id, winner)
+
+        async with database.SessionLocal() as session:
+            session.info["user_id"] = self.user_id
+            chat = await self._stored_chat(session, chat_id)
+            if chat is None:
+                race.cancel()
+                return
+            assistant_message = await regeneration.select_reply(
+                session, chat, anchor, winner
+            )
+            await session.commit()
+            await session.refresh(assistant_message)
+
+        regeneration.store_alternatives_later(
+            self.user_id, chat_id, anchor.id, [], race.losers(), self.ledger, self.bus
+        )
+        self.in_flight.discard(chat_id)
+        await self.bus.publish(
+            *events.turn_completed(self.user_id, chat_id, [assistant_message])
+        )
+        await self._send_done(chat_id, message=assistant_message)
+
+
+async def _authenticate(websocket: WebSocket, settings: Settings) -> User | None:
+    """Resolve the user from a ``?token=`` query or a first ``auth`` frame."""
+    token = websocket.query_params.get("token")
+    if token is None:
+        try:
+            frame = await asyncio.wait_for(
+                websocket.receive_json(), timeout=settings.ws_auth_timeout_seconds
+            )
+        except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+            return None
+        if isinstance(frame, dict) and frame.get("type") == "auth":
+            token = frame.get("token")
+    if not isinstance(token, str):
+        return None
+
+    try:
+        user_id = decode_access_token(token, settings)
+    except (JWTError, ValueError):
+        return None
+
+    async with database.SessionLocal() as session:
+        result = await session.execute(select(User).where(User.id == user_id))
+        return result.scalar_one_or_none()
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket) -> None:
+    """Authenticate once, then multiplex chat turns and events for the user."""
+    settings = get_settings()
+    await websocket.accept()
+
+    user = await _authenticate(websocket, settings)
+    if user is None:
+        await websocket.close(
+            code=status.WS_1008_POLICY_VIOLATION, reason="Could not validate credentials"
+        )
+        return
+    if not settings.open_router_api_key:
+        await websocket.close(
+            code=status.WS_1011_INTERNAL_ERROR,
+            reason="OpenRouter API key is not configured on the server.",
+        )
+        return
+
+    state = websocket.app.state
+    limits = getattr(state, "rate_limits", {})
+    connection = ChatConnection(
+        websocket,
+        user,
+        settings,
+        get_event_bus(),
+        get_usage_ledger(),
+        rate_limit_backend=getattr(state, "rate_limit_backend", None),
+        send_limit=limits.get("send"),
+    )
+    await websocket.send_json({"type": "ready", "user_id": str(user.id)})
+    try:
+        await connection.run()
+    except Exception:
+        logger.exception("WebSocket connection for %s failed", user.id)
+    finally:
+        with contextlib.suppress(RuntimeError):
+            await websocket.close()
@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from uuid import UUID
 
 from pydantic import BaseModel, EmailStr, Field
@@ -66,6 +66,9 @@ class ChatBase(BaseModel):
     id: UUID
     title: str
     model_name: str
+    message_count: int = 0
+    last_message_at: datetime | None = None
+    last_message_preview: str | None = None
     created_at: datetime
     updated_at: datetime
 
@@ -95,6 +98,8 @@ class MessageBase(BaseModel):
     role: str
     content: str
     model_name: str | None
+    parent_id: UUID | None = None
+    selected: bool = True
     created_at: datetime
 
     model_config = {"from_attributes": True, "protected_namespaces": ()}
@@ -110,8 +115,47 @@ class MessageRead(MessageBase):
     """Message returned to the client."""
 
 
+class RegenerateRequest(BaseModel):
+    """Options for regenerating the reply to the last user message."""
+
+    candidates: int = Field(default=1, ge=1, le=4)
+    temperatures: list[float] | None = Field(default=None, min_length=1)
+    models: list[str] | None = Field(default=None, min_length=1)
+
+    model_config = {"protected_namespaces": ()}
+
+
 class ChatDetail(ChatBase):
     """Chat including its messages."""
 
     messages: list[MessageRead]
 
+
+class ChatImportResult(BaseModel):
+    """Summary of a completed chat import."""
+
+    chats: int
+    messages: int
+
+
+class UsageDayRead(BaseModel):
+    """Aggregated token usage for one day and model."""
+
+    day: date
+    model_name: str
+    request_count: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_prompt_tokens: int = 0
+    prompt_cache_hit_rate: float = 0.0
+    average_latency_ms: float
+
+    model_config = {"protected_namespaces": ()}
+
+
+class UsageReport(BaseModel):
+    """Usage rollups for the current user plus today's quota status."""
+
+    daily_token_quota: int | None
+    tokens_used_today: int
+    days: list[UsageDayRead]
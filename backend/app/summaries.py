@@ -0,0 +1,149 @@
+"""Maintenance of the denormalized chat summary columns."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections.abc import Sequence
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import database
+from .config import get_settings
+from .models import Chat, Message
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 200
+REPAIR_BATCH_SIZE = 500
+
+
+def make_preview(content: str) -> str:
+    """Collapse whitespace and truncate message content for the sidebar."""
+    preview = " ".join(content.split())
+    if len(preview) <= PREVIEW_LENGTH:
+        return preview
+    return preview[: PREVIEW_LENGTH - 1] + "…"
+
+
+def record_messages(
+    chat: Chat, messages: Sequence[Message], *, replaced: int = 0
+) -> None:
+    """Update ``chat``'s summary for messages added in the same transaction.
+
+    ``replaced`` counts previously selected messages that the new ones
+    supersede. The counter is changed in SQL so concurrent turns on one chat
+    do not lose updates. Call this before committing the new messages.
+    """
+    if not messages:
+        return
+    now = datetime.now(timezone.utc)
+    chat.message_count = Chat.message_count + (len(messages) - replaced)
+    chat.version = Chat.version + 1
+    chat.last_message_at = now
+    chat.last_message_preview = make_preview(messages[-1].content)
+    chat.updated_at = now
+
+
+async def refresh_chat_summaries(
+    session: AsyncSession, chat_ids: Sequence[uuid.UUID]
+) -> None:
+    """Recompute the summary columns of ``chat_ids`` from selected messages.
+
+    ``updated_at`` is left alone: a repair is not activity on the chat, but
+    ``version`` is bumped so cached listings and details revalidate.
+    Archived chats are skipped; their messages are not in ``messages`` and
+    their summaries were frozen when they were archived.
+    """
+    if not chat_ids:
+        return
+    refreshable = Chat.id.in_(chat_ids) & Chat.archived_at.is_(None)
+    visible = (Message.chat_id == Chat.id) & Message.selected.is_(True)
+    latest = (
+        select(Message.content)
+        .where(visible)
+        .order_by(Message.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    await session.execute(
+        update(Chat)
+        .where(refreshable)
+        .values(
+            message_count=select(func.count(Message.id))
+            .where(visible)
+            .scalar_subquery(),
+            last_message_at=select(func.max(Message.created_at))
+            .where(visible)
+            .scalar_subquery(),
+            version=Chat.version + 1,
+            updated_at=Chat.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    # Previews go through ``make_preview`` so they match incremental updates.
+    result = await session.execute(
+        select(Chat.id, latest.label("content")).where(refreshable)
+    )
+    previews = [
+        {
+            "chat_id": chat_id,
+            "preview": make_preview(content) if content is not None else None,
+        }
+        for chat_id, content in result.all()
+    ]
+    if not previews:
+        return
+    table = Chat.__table__
+    await session.execute(
+        update(table)
+        .where(table.c.id == bindparam("chat_id"))
+        .values(
+            last_message_preview=bindparam("preview"),
+            updated_at=table.c.updated_at,
+        ),
+        previews,
+    )
+
+
+async def repair_chat_summaries(batch_size: int = REPAIR_BATCH_SIZE) -> int:
+    """Recompute every chat's summary, committing one batch of chats at a time.
+
+    Walks ``chats`` by primary key so each batch is a short transaction and
+    the job can run against a live database. Returns the number of chats.
+    """
+    if database.SessionLocal is None:
+        raise RuntimeError("Database engine has not been initialised.")
+
+    repaired = 0
+    last_id: uuid.UUID | None = None
+    while True:
+        async with database.SessionLocal() as session:
+            statement = select(Chat.id).order_by(Chat.id).limit(batch_size)
+            if last_id is not None:
+                statement = statement.where(Chat.id > last_id)
+            chat_ids = list((await session.execute(statement)).scalars().all())
+            if not chat_ids:
+                return repaired
+            await refresh_chat_summaries(session, chat_ids)
+            await session.commit()
+        repaired += len(chat_ids)
+        last_id = chat_ids[-1]
+
+
+async def _main() -> None:
+    await database.init_engine(get_settings())
+    try:
+        repaired = await repair_chat_summaries()
+        logger.info("Repaired summaries for %d chats", repaired)
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,305 @@
+"""Streaming NDJSON export and import of a user's chats."""
+
+from __future__ import annotations
+
+import json
+import uuid
+import zlib
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import case, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import archive, database, summaries
+from .models import Chat, Message
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_FETCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_LINE_BYTES = 1024 * 1024
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import stream does not follow the export format."""
+
+
+def _encode_line(record: dict[str, Any]) -> bytes:
+    return (
+        json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+        + "\n"
+    ).encode("utf-8")
+
+
+def _parse_datetime(value: Any) -> datetime | None:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError) as exc:
+        raise ImportFormatError(f"Invalid timestamp: {value!r}") from exc
+
+
+async def iter_export_lines(user_id: uuid.UUID) -> AsyncIterator[bytes]:
+    """Yield one NDJSON line per chat and message owned by ``user_id``.
+
+    Rows are pulled through a server-side cursor in fixed-size batches, so
+    memory use does not depend on the size of the account. The generator
+    opens its own session because it outlives the request's dependencies.
+    Archived chats are read from the cold store without rehydrating them.
+    """
+    if database.SessionLocal is None:
+        raise RuntimeError("Database engine has not been initialised.")
+
+    statement = (
+        select(
+            Chat.id,
+            Chat.title,
+            Chat.model_name,
+            Chat.created_at,
+            Chat.updated_at,
+            Chat.archived_at,
+            Message.role,
+            Message.content,
+            Message.model_name,
+            Message.created_at,
+        )
+        .outerjoin(
+            Message, (Message.chat_id == Chat.id) & Message.selected.is_(True)
+        )
+        .where(Chat.user_id == user_id)
+        # A turn's messages can share a timestamp; keep the user message first.
+        .order_by(
+            Chat.created_at,
+            Chat.id,
+            Message.created_at,
+            case((Message.role == "user", 0), else_=1),
+            Message.id,
+        )
+        .execution_options(yield_per=EXPORT_FETCH_SIZE)
+    )
+
+    yield _encode_line({"type": "export", "version": EXPORT_FORMAT_VERSION})
+
+    async with database.SessionLocal() as session, database.SessionLocal() as cold:
+        result = await session.stream(statement)
+        current_chat: uuid.UUID | None = None
+        async for row in result:
+            (
+                chat_id,
+                title,
+                chat_model,
+                chat_created,
+                chat_updated,
+                chat_archived,
+                role,
+                content,
+                message_model,
+                message_created,
+            ) = row
+            if chat_id != current_chat:
+                current_chat = chat_id
+                yield _encode_line(
+                    {
+                        "type": "chat",
+                        "id": str(chat_id),
+                        "title": title,
+                        "model_name": chat_model,
+                        "created_at": chat_created.isoformat(),
+                        "updated_at": chat_updated.isoformat(),
+                    }
+                )
+                if chat_archived is not None:
+                    for record in await archive.load_archived_records(cold, chat_id):
+                        if record.get("selected", True):
+                            yield _encode_line(
+                                {
+                                    "type": "message",
+                                    "chat_id": str(chat_id),
+                                    "role": record["role"],
+                                    "content": record["content"],
+                                    "model_name": record.get("model_name"),
+                                    "created_at": record["created_at"],
+                                }
+                            )
+            if role is None:
+                continue
+            yield _encode_line(
+                {
+                    "type": "message",
+                    "chat_id": str(chat_id),
+                    "role": role,
+                    "content": content,
+                    "model_name": message_model,
+                    "created_at": message_created.isoformat(),
+                }
+            )
+
+
+async def iter_export_chunks(
+    user_id: uuid.UUID, *, compress: bool = False
+) -> AsyncIterator[bytes]:
+    """Group export lines into chunks, optionally gzip-compressed."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+
+    async for line in iter_export_lines(user_id):
+        buffer += line
+        if len(buffer) < EXPORT_CHUNK_BYTES:
+            continue
+        chunk = bytes(buffer)
+        buffer.clear()
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+            if not chunk:
+                continue
+        yield chunk
+
+    tail = bytes(buffer)
+    if compressor is not None:
+        tail = compressor.compress(tail) + compressor.flush()
+    if tail:
+        yield tail
+
+
+async def iter_ndjson_records(
+    chunks: AsyncIterable[bytes], *, compressed: bool = False
+) -> AsyncIterator[dict[str, Any]]:
+    """Decode an NDJSON byte stream (plain or gzip) into records."""
+    decompressor = zlib.decompressobj(wbits=47) if compressed else None
+    pending = b""
+
+    async for chunk in chunks:
+        pieces = [chunk] if decompressor is None else _inflate(decompressor, chunk)
+        for piece in pieces:
+            pending += piece
+            *lines, pending = pending.split(b"\n")
+            if len(pending) > IMPORT_MAX_LINE_BYTES:
+                raise ImportFormatError("Import line exceeds the maximum size.")
+            for line in lines:
+                if line.strip():
+                    yield _decode_line(line)
+
+    if decompressor is not None:
+        pending += decompressor.flush()
+    if pending.strip():
+        yield _decode_line(pending)
+
+
+def _inflate(decompressor: Any, data: bytes) -> Iterator[bytes]:
+    # Bounded steps keep a small, highly compressed chunk from expanding
+    # into one huge buffer before the line-size check can run.
+    while data:
+        yield decompressor.decompress(data, IMPORT_MAX_LINE_BYTES)
+        data = decompressor.unconsumed_tail
+
+
+def _decode_line(line: bytes) -> dict[str, Any]:
+    try:
+        record = json.loads(line)
+    except ValueError as exc:
+        raise ImportFormatError("Import stream contains invalid JSON.") from exc
+    if not isinstance(record, dict) or "type" not in record:
+        raise ImportFormatError("Import records must be objects with a type.")
+    return record
+
+
+async def _insert_batch(
+    session: AsyncSession, model: type[Chat] | type[Message], rows: list[dict[str, Any]]
+) -> None:
+    if rows:
+        await session.execute(insert(model), rows)
+        rows.clear()
+
+
+async def import_records(
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    records: AsyncIterable[dict[str, Any]],
+    *,
+    default_model: str,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> tuple[int, int]:
+    """Insert exported chats and messages for ``user_id`` in batches.
+
+    Imported chats always receive fresh ids so an export can be re-imported
+    next to the original data. Returns the number of chats and messages
+    created; the caller owns the transaction.
+    """
+    chat_ids: dict[str, uuid.UUID] = {}
+    chat_rows: list[dict[str, Any]] = []
+    message_rows: list[dict[str, Any]] = []
+    message_total = 0
+
+    async for record in records:
+        kind = record["type"]
+        if kind == "export":
+            if record.get("version") != EXPORT_FORMAT_VERSION:
+                raise ImportFormatError("Unsupported export format version.")
+        elif kind == "chat":
+            source_id = str(record.get("id"))
+            if source_id in chat_ids:
+                raise ImportFormatError(f"Duplicate chat id: {source_id}")
+            chat_ids[source_id] = uuid.uuid4()
+            row: dict[str, Any] = {
+                "id": chat_ids[source_id],
+                "user_id": user_id,
+                "title": str(record.get("title") or "New Chat")[:255],
+                "model_name": str(record.get("model_name") or default_model)[:100],
+            }
+            for column in ("created_at", "updated_at"):
+                value = _parse_datetime(record.get(column))
+                if value is not None:
+                    row[column] = value
+            chat_rows.append(row)
+            if len(chat_rows) >= batch_size:
+                await _insert_batch(session, Chat, chat_rows)
+        elif kind == "message":
+            target = chat_ids.get(str(record.get("chat_id")))
+            if target is None:
+                raise ImportFormatError("Message references an unknown chat.")
+            role = record.get("role")
+            content = record.get("content")
+            if role not in {"user", "assistant", "system"} or not isinstance(
+                content, str
+            ):
+                raise ImportFormatError("Message has an invalid role or content.")
+            model_name = record.get("model_name")
+            if model_name is not None and not isinstance(model_name, str):
+                raise ImportFormatError("Message has an invalid model name.")
+            row = {
+                "id": uuid.uuid4(),
+                "chat_id": target,
+                "role": role,
+                "content": content,
+                "model_name": model_name[:100] if model_name else None,
+            }
+            created_at = _parse_datetime(record.get("created_at"))
+            if created_at is not None:
+                row["created_at"] = created_at
+            message_rows.append(row)
+            message_total += 1
+            if len(message_rows) >= batch_size:
+                # Chats must exist before their messages reference them.
+                await _insert_batch(session, Chat, chat_rows)
+                await _insert_batch(session, Message, message_rows)
+        else:
+            raise ImportFormatError(f"Unknown record type: {kind!r}")
+
+    await _insert_batch(session, Chat, chat_rows)
+    await _insert_batch(session, Message, message_rows)
+
+    imported = list(chat_ids.values())
+    for start in range(0, len(imported), batch_size):
+        await summaries.refresh_chat_summaries(
+            session, imported[start : start + batch_size]
+        )
+    return len(chat_ids), message_total
+
+
+def export_filename(compress: bool, *, now: datetime | None = None) -> str:
+    """Return the download filename for an export."""
+    stamp = (now or datetime.now()).strftime("%Y%m%d-%H%M%S")
+    return f"chats-{stamp}.ndjson" + (".gz" if compress else "")
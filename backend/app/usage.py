@@ -0,0 +1,291 @@
+"""In-memory usage ledger with periodic batched flushes to daily rollups."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import database
+from .config import Settings
+from .models import UsageDaily
+
+logger = logging.getLogger(__name__)
+
+UsageKey = tuple[date, uuid.UUID, uuid.UUID, str]
+
+REFRESH_BATCH_SIZE = 500
+
+
+@dataclass
+class UsageDelta:
+    """Counters accumulated for a single rollup row between flushes."""
+
+    request_count: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: int = 0
+    cached_prompt_tokens: int = 0
+
+    def add(self, other: UsageDelta) -> None:
+        self.request_count += other.request_count
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.latency_ms += other.latency_ms
+        self.cached_prompt_tokens += other.cached_prompt_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def parse_usage(data: dict[str, Any]) -> tuple[int, int, int]:
+    """Return ``(prompt, completion, cached prompt)`` token counts from a response."""
+    usage = data.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    try:
+        return (
+            int(usage.get("prompt_tokens") or 0),
+            int(usage.get("completion_tokens") or 0),
+            int(details.get("cached_tokens") or 0),
+        )
+    except (AttributeError, TypeError, ValueError):
+        return 0, 0, 0
+
+
+class UsageLedger:
+    """Buffer usage increments in memory and upsert them in batches.
+
+    Quota checks are served from a per-user counter for the current day. The
+    counter is seeded from the database the first time a user is seen each
+    day and incremented locally afterwards, so the hot path never queries.
+    Every flush re-reads the counters from ``usage_daily``, which picks up
+    what other workers spent and drops counters of past days.
+    """
+
+    def __init__(self, daily_token_quota: int | None = None) -> None:
+        self.daily_token_quota = daily_token_quota
+        self._pending: dict[UsageKey, UsageDelta] = {}
+        self._tokens_today: dict[uuid.UUID, tuple[date, int]] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def record(
+        self,
+        *,
+        user_id: uuid.UUID,
+        chat_id: uuid.UUID,
+        model_name: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency_ms: int,
+        cached_prompt_tokens: int = 0,
+    ) -> None:
+        """Add one completed upstream request to the pending buffer."""
+        day = _today()
+        key = (day, user_id, chat_id, model_name)
+        delta = UsageDelta(
+            1, prompt_tokens, completion_tokens, latency_ms, cached_prompt_tokens
+        )
+        self._pending.setdefault(key, UsageDelta()).add(delta)
+
+        cached = self._tokens_today.get(user_id)
+        if cached is not None and cached[0] == day:
+            self._tokens_today[user_id] = (day, cached[1] + delta.total_tokens)
+
+    def pending_for_user(self, user_id: uuid.UUID) -> dict[UsageKey, UsageDelta]:
+        """Return unflushed counters belonging to ``user_id``."""
+        return {
+            key: delta for key, delta in self._pending.items() if key[1] == user_id
+        }
+
+    async def tokens_used_today(
+        self, session: AsyncSession, user_id: uuid.UUID
+    ) -> int:
+        """Return today's token total for ``user_id``, hitting the DB once a day."""
+        day = _today()
+        cached = self._tokens_today.get(user_id)
+        if cached is not None and cached[0] == day:
+            return cached[1]
+
+        # A running flush has taken its batch out of ``_pending`` but may not
+        # have committed it yet; seeding under the lock counts it exactly once.
+        async with self._flush_lock:
+            cached = self._tokens_today.get(user_id)
+            if cached is not None and cached[0] == day:
+                return cached[1]
+            result = await session.execute(
+                select(
+                    func.coalesce(
+                        func.sum(
+                            UsageDaily.prompt_tokens + UsageDaily.completion_tokens
+                        ),
+                        0,
+                    )
+                ).where(UsageDaily.user_id == user_id, UsageDaily.day == day)
+            )
+            total = int(result.scalar_one()) + sum(
+                delta.total_tokens
+                for key, delta in self.pending_for_user(user_id).items()
+                if key[0] == day
+            )
+            self._tokens_today[user_id] = (day, total)
+        return total
+
+    async def quota_exceeded(self, session: AsyncSession, user_id: uuid.UUID) -> bool:
+        """Return True when the user has used up today's token quota."""
+        if self.daily_token_quota is None:
+            return False
+        used = await self.tokens_used_today(session, user_id)
+        return used >= self.daily_token_quota
+
+    async def flush(self) -> int:
+        """Write all pending counters with one batched upsert. Returns row count."""
+        async with self._flush_lock:
+            if database.SessionLocal is None:
+                return 0
+            if not self._pending and not self._tokens_today:
+                return 0
+            batch, self._pending = self._pending, {}
+            async with database.SessionLocal() as session:
+                if batch:
+                    try:
+                        await self._upsert(session, batch)
+                        await session.commit()
+                    except Exception:
+                        # Put the counters back so the next flush retries them.
+                        for key, delta in batch.items():
+                            self._pending.setdefault(key, UsageDelta()).add(delta)
+                        raise
+                await self._refresh_totals(session)
+            return len(batch)
+
+    async def _refresh_totals(self, session: AsyncSession) -> None:
+        """Reload cached daily totals, which include other workers' usage."""
+        day = _today()
+        self._tokens_today = {
+            user_id: cached
+            for user_id, cached in self._tokens_today.items()
+            if cached[0] == day
+        }
+        user_ids = list(self._tokens_today)
+        for start in range(0, len(user_ids), REFRESH_BATCH_SIZE):
+            chunk = user_ids[start : start + REFRESH_BATCH_SIZE]
+            result = await session.execute(
+                select(
+                    UsageDaily.user_id,
+                    func.sum(UsageDaily.prompt_tokens + UsageDaily.completion_tokens),
+                )
+                .where(UsageDaily.day == day, UsageDaily.user_id.in_(chunk))
+                .group_by(UsageDaily.user_id)
+            )
+            totals = dict.fromkeys(chunk, 0)
+            totals.update((user_id, int(total)) for user_id, total in result.all())
+            # Usage recorded since the last upsert is still pending; add it back.
+            for (pending_day, user_id, _, _), delta in self._pending.items():
+                if pending_day == day and user_id in totals:
+                    totals[user_id] += delta.total_tokens
+            for user_id, total in totals.items():
+                if user_id in self._tokens_today:
+                    self._tokens_today[user_id] = (day, total)
+
+    @staticmethod
+    async def _upsert(
+        session: AsyncSession, batch: dict[UsageKey, UsageDelta]
+    ) -> None:
+        table = UsageDaily.__table__
+        statement = database.upsert_statement(
+            session.get_bind().dialect.name, table
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[
+                table.c.day,
+                table.c.user_id,
+                table.c.chat_id,
+                table.c.model_name,
+            ],
+            set_={
+                column: table.c[column] + statement.excluded[column]
+                for column in (
+                    "request_count",
+                    "prompt_tokens",
+                    "completion_tokens",
+                    "latency_ms",
+                    "cached_prompt_tokens",
+                )
+            },
+        )
+        rows = [
+            {
+                "day": day,
+                "user_id": user_id,
+                "chat_id": chat_id,
+                "model_name": model_name,
+                "request_count": delta.request_count,
+                "prompt_tokens": delta.prompt_tokens,
+                "completion_tokens": delta.completion_tokens,
+                "latency_ms": delta.latency_ms,
+                "cached_prompt_tokens": delta.cached_prompt_tokens,
+            }
+            for (day, user_id, chat_id, model_name), delta in batch.items()
+        ]
+        await session.execute(statement, rows)
+
+
+ledger: UsageLedger | None = None
+_flush_task: asyncio.Task[None] | None = None
+
+
+async def _flush_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        if ledger is None:
+            continue
+        try:
+            await ledger.flush()
+        except Exception:
+            logger.exception("Failed to flush usage ledger")
+
+
+async def init_usage_ledger(settings: Settings) -> None:
+    """Create the ledger and start its background flush task."""
+    global ledger, _flush_task
+
+    if ledger is None:
+        ledger = UsageLedger(daily_token_quota=settings.usage_daily_token_quota)
+        _flush_task = asyncio.create_task(
+            _flush_periodically(settings.usage_flush_interval_seconds)
+        )
+
+
+async def close_usage_ledger() -> None:
+    """Stop the flush task and write out whatever is still buffered."""
+    global ledger, _flush_task
+
+    if _flush_task is not None:
+        _flush_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _flush_task
+        _flush_task = None
+    if ledger is not None:
+        try:
+            await ledger.flush()
+        finally:
+            ledger = None
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Return the active usage ledger."""
+    if ledger is None:
+        raise RuntimeError("Usage ledger has not been initialised.")
+    return ledger
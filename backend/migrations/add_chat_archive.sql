@@ -0,0 +1,23 @@
+-- Migration: Cold storage for idle chats
+-- Description: Messages of chats untouched for ARCHIVE_AFTER_DAYS are moved
+-- into archived_chats as one gzip-compressed NDJSON payload per chat and are
+-- moved back when the chat is opened again.
+
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITH TIME ZONE;
+
+CREATE TABLE IF NOT EXISTS archived_chats (
+    chat_id UUID PRIMARY KEY REFERENCES chats (id) ON DELETE CASCADE,
+    payload BYTEA NOT NULL,
+    message_count INTEGER NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_chats_hot_updated_at ON chats (updated_at)
+    WHERE archived_at IS NULL;
+
+-- Rehydrating on read leaves updated_at alone; this keeps such chats hot.
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS rehydrated_at TIMESTAMP WITH TIME ZONE;
+
+-- Lets the storage report sum sizes without reading every payload.
+ALTER TABLE archived_chats ADD COLUMN IF NOT EXISTS payload_bytes INTEGER NOT NULL DEFAULT 0;
+UPDATE archived_chats SET payload_bytes = length(payload) WHERE payload_bytes = 0;
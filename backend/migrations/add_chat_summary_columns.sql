@@ -0,0 +1,20 @@
+-- Migration: Add denormalized summary columns to chats table
+-- Description: Stores message count, last message time and a preview on each
+-- chat so the sidebar listing does not need to aggregate messages.
+
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS last_message_preview VARCHAR(200);
+
+CREATE INDEX IF NOT EXISTS ix_chats_user_id_updated_at ON chats (user_id, updated_at);
+
+-- Backfill existing chats (or run `python -m app.summaries` to do it in batches).
+UPDATE chats SET
+    message_count = (SELECT COUNT(*) FROM messages WHERE messages.chat_id = chats.id),
+    last_message_at = (SELECT MAX(created_at) FROM messages WHERE messages.chat_id = chats.id),
+    last_message_preview = (
+        SELECT SUBSTR(content, 1, 200) FROM messages
+        WHERE messages.chat_id = chats.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    );
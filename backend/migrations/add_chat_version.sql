@@ -0,0 +1,5 @@
+-- Migration: Add a version counter to chats table
+-- Description: Bumped by every write that changes a chat's messages so the
+-- chat's ETag can be read from its row without counting messages.
+
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,22 @@
+-- Migration: Link assistant replies to their user turn
+-- Description: Regenerated replies are stored as sibling assistant messages
+-- sharing a parent; only the selected one is part of the chat history.
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS parent_id UUID REFERENCES messages (id) ON DELETE CASCADE;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS selected BOOLEAN NOT NULL DEFAULT TRUE;
+
+CREATE INDEX IF NOT EXISTS ix_messages_parent_id ON messages (parent_id);
+
+-- Replies stored before this migration have no parent and could never be
+-- selected again once replaced; link each to the nearest preceding user message.
+UPDATE messages AS reply
+SET parent_id = (
+    SELECT turn.id
+    FROM messages AS turn
+    WHERE turn.chat_id = reply.chat_id
+      AND turn.role = 'user'
+      AND turn.created_at <= reply.created_at
+    ORDER BY turn.created_at DESC, turn.id DESC
+    LIMIT 1
+)
+WHERE reply.role = 'assistant' AND reply.parent_id IS NULL;
@@ -0,0 +1,80 @@
+-- Migration: Partition messages by month (PostgreSQL only)
+-- Description: Rebuilds `messages` as a table range-partitioned on created_at
+-- with one partition per month and a default partition. Existing rows are
+-- copied inside a single transaction, so run it in a maintenance window.
+--
+-- Notes:
+--   * The primary key becomes (id, created_at): unique constraints on a
+--     partitioned table must contain the partition key. Ids stay UUIDs.
+--   * The self-referencing foreign key on parent_id is dropped for the same
+--     reason. Replies are still removed together with their chat.
+--   * The API calls create_message_partitions() in the background, keeping
+--     MESSAGE_PARTITION_MONTHS_AHEAD future months in place so new rows never
+--     land in the default partition. A month cannot be created while the
+--     default partition holds rows for it; move those rows out first.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION create_message_partitions(
+    months_ahead INTEGER,
+    since DATE DEFAULT NULL
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start DATE := date_trunc('month', COALESCE(since, now()))::date;
+    last_month DATE := (
+        date_trunc('month', now()) + make_interval(months => months_ahead)
+    )::date;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('messages_%s', to_char(month_start, 'YYYY_MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                month_start,
+                (month_start + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+ALTER TABLE messages RENAME TO messages_unpartitioned;
+
+CREATE TABLE messages (
+    id UUID NOT NULL,
+    chat_id UUID NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+    role VARCHAR(50) NOT NULL,
+    content TEXT NOT NULL,
+    model_name VARCHAR(100),
+    parent_id UUID,
+    selected BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+SELECT create_message_partitions(
+    3, (SELECT min(created_at)::date FROM messages_unpartitioned)
+);
+
+INSERT INTO messages (
+    id, chat_id, role, content, model_name, parent_id, selected, created_at
+)
+SELECT id, chat_id, role, content, model_name, parent_id, selected, created_at
+FROM messages_unpartitioned;
+
+DROP TABLE messages_unpartitioned;
+
+-- Created after the copy; the old table's index names are free again now.
+ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (id, created_at);
+CREATE INDEX ix_messages_chat_id ON messages (chat_id, created_at);
+CREATE INDEX ix_messages_parent_id ON messages (parent_id);
+
+COMMIT;
@@ -0,0 +1,41 @@
+import uuid
+
+import pytest_asyncio
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+
+from app import database
+from app.models import Base, User
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_as_json(type_, compiler, **kw):
+    return "JSON"
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    """Point the app's session factory at a fresh SQLite database."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker)
+    yield sessionmaker
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def user(db):
+    async with db() as session:
+        user = User(
+            id=uuid.uuid4(),
+            email=f"{uuid.uuid4().hex}@example.com",
+            password_hash="x",
+            display_name="Tester",
+        )
+        session.add(user)
+        await session.commit()
+    return user
@@ -0,0 +1,130 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app import archive
+from app.archive import LatencyStats, _message_row, decode_messages, encode_messages
+from app.models import ArchivedChat, Chat, Message
+from app.routers.chats import _chat_etag_or_404
+from app.summaries import refresh_chat_summaries
+
+LONG_AGO = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+async def _idle_chat(db, user):
+    async with db() as session:
+        chat = Chat(
+            user_id=user.id,
+            title="t",
+            model_name="m",
+            message_count=1,
+            last_message_preview="hi",
+            updated_at=LONG_AGO,
+        )
+        session.add(chat)
+        await session.flush()
+        session.add(
+            Message(chat_id=chat.id, role="user", content="hi", created_at=LONG_AGO)
+        )
+        await session.commit()
+    return chat
+
+
+def test_messages_round_trip_through_cold_payload():
+    records = [
+        {"id": str(uuid.uuid4()), "role": "user", "content": "привет 🐾"},
+        {"id": str(uuid.uuid4()), "role": "assistant", "content": "hi\nthere"},
+    ]
+    assert decode_messages(encode_messages(records)) == records
+
+
+def test_message_row_restores_types():
+    chat_id = uuid.uuid4()
+    parent_id = uuid.uuid4()
+    created_at = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    row = _message_row(
+        {
+            "id": str(uuid.uuid4()),
+            "role": "assistant",
+            "content": "hello",
+            "model_name": None,
+            "parent_id": str(parent_id),
+            "selected": False,
+            "created_at": created_at.isoformat(),
+        },
+        chat_id,
+    )
+    assert row["chat_id"] == chat_id
+    assert row["parent_id"] == parent_id
+    assert row["selected"] is False
+    assert row["created_at"] == created_at
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    assert stats.to_dict()["average_ms"] == 0.0
+    stats.add(10.0)
+    stats.add(30.0)
+    assert stats.to_dict() == {
+        "count": 2,
+        "average_ms": 20.0,
+        "max_ms": 30.0,
+        "last_ms": 30.0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_rehydrated_chat_is_not_archived_again(db, user):
+    chat = await _idle_chat(db, user)
+    assert await archive.archive_idle_chats(1) == 1
+
+    assert await archive.ensure_hot(chat.id, user.id)
+
+    assert await archive.archive_idle_chats(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_archiving_keeps_the_etag(db, user):
+    chat = await _idle_chat(db, user)
+    async with db() as session:
+        hot = await _chat_etag_or_404(session, chat.id, user, False)
+    await archive.archive_idle_chats(1)
+
+    async with db() as session:
+        cold = await _chat_etag_or_404(session, chat.id, user, False)
+        archived_at = await session.scalar(
+            select(Chat.archived_at).where(Chat.id == chat.id)
+        )
+
+    assert cold == hot
+    assert archived_at is not None
+
+
+@pytest.mark.asyncio
+async def test_summary_refresh_leaves_archived_chats_alone(db, user):
+    chat = await _idle_chat(db, user)
+    await archive.archive_idle_chats(1)
+
+    async with db() as session:
+        await refresh_chat_summaries(session, [chat.id])
+        await session.commit()
+        refreshed = await session.get(Chat, chat.id)
+
+    assert refreshed.message_count == 1
+    assert refreshed.last_message_preview == "hi"
+
+
+@pytest.mark.asyncio
+async def test_storage_report_uses_stored_payload_sizes(db, user):
+    chat = await _idle_chat(db, user)
+    await archive.archive_idle_chats(1)
+
+    async with db() as session:
+        payload = await session.scalar(
+            select(ArchivedChat.payload).where(ArchivedChat.chat_id == chat.id)
+        )
+        report = await archive.storage_report(session)
+
+    assert report["cold"] == {"chats": 1, "messages": 1, "bytes": len(payload)}
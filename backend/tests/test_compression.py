@@ -0,0 +1,69 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.compression import CompressionMiddleware, negotiate
+
+LARGE_BODY = "<table><tr><td>cell</td></tr></table>\n" * 200
+
+
+async def large(request):
+    return PlainTextResponse(LARGE_BODY, headers={"ETag": 'W/"v1"'})
+
+
+async def small(request):
+    return PlainTextResponse("ok")
+
+
+async def stream(request):
+    async def chunks():
+        for index in range(3):
+            yield f"data: {index}\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+def _client():
+    app = Starlette(
+        routes=[Route("/large", large), Route("/small", small), Route("/stream", stream)]
+    )
+    transport = ASGITransport(app=CompressionMiddleware(app, minimum_size=500))
+    return AsyncClient(transport=transport, base_url="http://testserver")
+
+
+def test_negotiate_respects_quality_values():
+    assert negotiate("gzip, br;q=0.5", ("zstd", "br", "gzip")) == "gzip"
+    assert negotiate("gzip;q=0.5, br", ("zstd", "br", "gzip")) == "br"
+    assert negotiate("identity", ("gzip",)) is None
+    assert negotiate("*", ("gzip",)) == "gzip"
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_compressed():
+    async with _client() as client:
+        response = await client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(LARGE_BODY)
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == LARGE_BODY
+
+
+@pytest.mark.asyncio
+async def test_small_responses_are_not_compressed():
+    async with _client() as client:
+        response = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == "ok"
+
+
+@pytest.mark.asyncio
+async def test_streaming_responses_are_compressed_per_chunk():
+    async with _client() as client:
+        response = await client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
@@ -0,0 +1,108 @@
+import pytest
+from fastapi import Response
+from sqlalchemy import select
+
+from app import regeneration, summaries
+from app.etag import etag_matches, weak_etag
+from app.events import InProcessEventBus
+from app.models import Chat, Message
+from app.routers.chats import get_chat, list_chats, list_messages
+from app.usage import UsageLedger
+
+
+def test_weak_etag_is_stable_and_version_sensitive():
+    assert weak_etag("chat", 3, "2024-01-01") == weak_etag("chat", 3, "2024-01-01")
+    assert weak_etag("chat", 3) != weak_etag("chat", 4)
+    assert weak_etag("chat").startswith('W/"')
+
+
+def test_etag_matches_uses_weak_comparison():
+    etag = weak_etag("chat", 1)
+    opaque = etag.removeprefix("W/")
+    assert etag_matches(etag, etag)
+    assert etag_matches(opaque, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('W/"other"', etag)
+
+
+async def _chat(db, user):
+    async with db() as session:
+        chat = Chat(user_id=user.id, title="t")
+        session.add(chat)
+        await session.commit()
+    return chat
+
+
+async def _append(db, chat, content):
+    async with db() as session:
+        chat = await session.get(Chat, chat.id)
+        message = Message(chat_id=chat.id, role="user", content=content)
+        session.add(message)
+        summaries.record_messages(chat, [message])
+        await session.commit()
+
+
+async def _get(db, user, route, *args, if_none_match=None):
+    response = Response()
+    async with db() as session:
+        result = await route(
+            *args,
+            response=response,
+            if_none_match=if_none_match,
+            current_user=user,
+            session=session,
+            **({} if route is list_chats else {"include_alternatives": True}),
+        )
+    if isinstance(result, Response):
+        return result.status_code, result.headers["etag"]
+    return 200, response.headers["etag"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("route", [get_chat, list_messages, list_chats])
+async def test_routes_revalidate_until_the_chat_changes(db, user, route):
+    chat = await _chat(db, user)
+    args = () if route is list_chats else (chat.id,)
+    status, etag = await _get(db, user, route, *args)
+    assert status == 200
+
+    assert await _get(db, user, route, *args, if_none_match=etag) == (304, etag)
+
+    await _append(db, chat, "hello")
+    status, changed = await _get(db, user, route, *args, if_none_match=etag)
+    assert status == 200
+    assert changed != etag
+
+
+@pytest.mark.asyncio
+async def test_stored_alternatives_change_the_chat_etag(db, user):
+    chat = await _chat(db, user)
+    await _append(db, chat, "hi")
+    async with db() as session:
+        turn = (await session.execute(select(Message.id))).scalar_one()
+    _, etag = await _get(db, user, get_chat, chat.id)
+
+    candidate = regeneration.Candidate("m", "alt", {}, 0)
+    await regeneration.store_alternatives(
+        user.id, chat.id, turn, [candidate], [], UsageLedger(), InProcessEventBus()
+    )
+    assert (await _get(db, user, get_chat, chat.id, if_none_match=etag))[0] == 200
+
+
+@pytest.mark.asyncio
+async def test_summary_repair_changes_the_list_etag(db, user):
+    chat = await _chat(db, user)
+    async with db() as session:
+        session.add(Message(chat_id=chat.id, role="user", content="hi"))
+        await session.commit()
+    _, etag = await _get(db, user, list_chats)
+
+    async with db() as session:
+        await summaries.refresh_chat_summaries(session, [chat.id])
+        await session.commit()
+
+    status, changed = await _get(db, user, list_chats, if_none_match=etag)
+    assert status == 200
+    assert changed != etag
@@ -0,0 +1,121 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.events import (
+    CHAT_RENAMED,
+    GENERATION_COMPLETED,
+    GENERATION_PROGRESS,
+    MESSAGE_APPENDED,
+    Event,
+    EventBus,
+    InProcessEventBus,
+    PostgresEventBus,
+    turn_completed,
+)
+from app.routers.realtime import _ProgressPublisher
+
+
+def test_event_json_roundtrip():
+    event = Event(CHAT_RENAMED, uuid.uuid4(), uuid.uuid4(), {"title": "Hi"})
+    assert Event.from_json(event.to_json()) == event
+
+
+@pytest.mark.asyncio
+async def test_in_process_bus_delivers_to_owner_only():
+    bus = InProcessEventBus(queue_size=2)
+    owner, other = uuid.uuid4(), uuid.uuid4()
+    seen = []
+    bus.add_listener(seen.append)
+
+    async with bus.subscribe(owner) as queue:
+        for index in range(3):
+            await bus.publish(Event(CHAT_RENAMED, owner, data={"n": index}))
+        await bus.publish(Event(CHAT_RENAMED, other))
+
+        # The full queue dropped the oldest event.
+        assert [queue.get_nowait().data["n"] for _ in range(2)] == [1, 2]
+        assert queue.empty()
+
+    assert len(seen) == 4
+    assert bus.subscriber_count() == 0
+
+
+def test_event_bus_is_abstract():
+    with pytest.raises(TypeError):
+        EventBus()
+
+
+@pytest.mark.asyncio
+async def test_turn_events_are_published_together():
+    bus = InProcessEventBus()
+    user_id, chat_id = uuid.uuid4(), uuid.uuid4()
+    messages = [
+        SimpleNamespace(id=uuid.uuid4(), role="user"),
+        SimpleNamespace(id=uuid.uuid4(), role="assistant"),
+    ]
+
+    async with bus.subscribe(user_id) as queue:
+        await bus.publish(*turn_completed(user_id, chat_id, messages))
+        received = [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert [event.type for event in received] == [
+        MESSAGE_APPENDED,
+        MESSAGE_APPENDED,
+        GENERATION_COMPLETED,
+    ]
+    assert received[-1].data == {"message_id": str(messages[1].id)}
+
+
+@pytest.mark.asyncio
+async def test_progress_events_are_throttled():
+    bus = InProcessEventBus()
+    user_id, chat_id = uuid.uuid4(), uuid.uuid4()
+    progress = _ProgressPublisher(bus, user_id, chat_id, interval=3600.0)
+
+    async with bus.subscribe(user_id) as queue:
+        for piece in ("Hel", "lo", " there"):
+            await progress.add(piece)
+        assert queue.empty()
+        await progress.flush()
+        progress.interval = 0.0
+        await progress.add("!")
+        received = [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert [event.type for event in received] == [GENERATION_PROGRESS] * 2
+    assert [event.data for event in received] == [
+        {"offset": 0, "content": "Hello there"},
+        {"offset": 11, "content": "!"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_postgres_bus_reconnects_after_termination(monkeypatch):
+    bus = PostgresEventBus()
+    attempts = []
+
+    async def connect():
+        attempts.append(True)
+        if len(attempts) < 2:
+            raise OSError("connection refused")
+
+    async def disconnect():
+        return None
+
+    monkeypatch.setattr(bus, "_connect", connect)
+    monkeypatch.setattr(bus, "_disconnect", disconnect)
+    monkeypatch.setattr(asyncio, "sleep", _no_sleep)
+
+    bus._on_terminate(None)
+    await bus._reconnect_task
+    assert len(attempts) == 2
+
+    bus._closing = True
+    bus._on_terminate(None)
+    assert bus._reconnect_task.done()
+
+
+async def _no_sleep(delay):
+    return None
@@ -1,11 +1,13 @@
 import os
 
 import pytest
+from fastapi import HTTPException
 from httpx import ASGITransport, AsyncClient
 os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///./test.db")
 os.environ.setdefault("OPENROUTER_API_KEY", "test-key")
 
-from app.config import get_settings  # noqa: E402
+from app.config import Settings, get_settings  # noqa: E402
+from app.deps import require_internal_token  # noqa: E402
 from app.main import app  # noqa: E402
 
 
@@ -25,3 +27,15 @@ async def test_health_endpoint():
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
+
+
+def test_storage_report_needs_the_internal_token():
+    with pytest.raises(HTTPException) as disabled:
+        require_internal_token(Settings(), "anything")
+    with pytest.raises(HTTPException) as wrong:
+        require_internal_token(Settings(internal_api_token="secret"), "guess")
+
+    assert disabled.value.status_code == 404
+    assert wrong.value.status_code == 403
+    allowed = require_internal_token(Settings(internal_api_token="secret"), "secret")
+    assert allowed is None
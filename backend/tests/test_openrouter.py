@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.models import Chat, Message
+from app.openrouter import build_messages, load_history, window_size, window_start
+
+
+def _settings(prefixes=("anthropic/",)):
+    return SimpleNamespace(
+        system_prompt="Be helpful.", prompt_cache_model_prefixes=list(prefixes)
+    )
+
+
+def test_window_start_moves_in_blocks():
+    assert window_start(total=10, limit=15, block=6) == 0
+    assert window_start(total=16, limit=15, block=6) == 6
+    assert window_start(total=21, limit=15, block=6) == 6
+    assert window_start(total=22, limit=15, block=6) == 12
+    assert window_start(total=22, limit=15, block=1) == 7
+
+
+def test_window_size_is_what_remains_after_window_start():
+    assert window_size(total=10, limit=15, block=6) == 15
+    assert window_size(total=16, limit=15, block=6) == 10
+    assert window_size(total=21, limit=15, block=6) == 15
+    assert window_size(total=22, limit=15, block=6) == 10
+    assert window_size(total=22, limit=15, block=1) == 15
+
+
+@pytest.mark.asyncio
+async def test_history_is_the_newest_aligned_window(db, user):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    async with db() as session:
+        chat = Chat(user_id=user.id, title="t", model_name="m")
+        session.add(chat)
+        await session.flush()
+        messages = [
+            Message(
+                chat_id=chat.id,
+                role="user" if index % 2 == 0 else "assistant",
+                content=str(index),
+                created_at=start + timedelta(seconds=index),
+            )
+            for index in range(9)
+        ]
+        session.add_all(messages)
+        await session.commit()
+
+        window = await load_history(session, chat.id, 5, total=9, block=3)
+        regenerated = await load_history(
+            session, chat.id, 5, total=7, block=3, until=messages[6]
+        )
+        new = Message(chat_id=chat.id, role="user", content="new")
+        with_pending = await load_history(
+            session, chat.id, 5, total=10, block=3, pending=[new]
+        )
+
+    assert [m.content for m in window] == ["6", "7", "8"]
+    assert [m.content for m in regenerated] == ["3", "4", "5", "6"]
+    assert [m.content for m in with_pending] == ["6", "7", "8", "new"]
+
+
+def test_build_messages_adds_cache_breakpoints():
+    history = [
+        SimpleNamespace(role="user", content="hi"),
+        SimpleNamespace(role="assistant", content="hello"),
+        SimpleNamespace(role="user", content="how are you?"),
+    ]
+    messages = build_messages(_settings(), history, "anthropic/claude")
+    assert messages[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert messages[-2]["content"][0]["text"] == "hello"
+    assert messages[-1]["content"] == "how are you?"
+
+
+def test_build_messages_plain_for_other_models():
+    history = [SimpleNamespace(role="user", content="hi")]
+    messages = build_messages(_settings(), history, "z-ai/glm-4.5-air:free")
+    assert messages == [
+        {"role": "system", "content": "Be helpful."},
+        {"role": "user", "content": "hi"},
+    ]
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import select
+
+from app.models import RateLimitBucket
+from app.ratelimit import (
+    DatabaseBackend,
+    MemoryBackend,
+    RateLimit,
+    RateLimitMiddleware,
+    route_group,
+)
+
+
+def test_parse_rate_limit():
+    limit = RateLimit.parse("20/minute")
+    assert limit.capacity == 20
+    assert limit.period == 60.0
+    with pytest.raises(ValueError):
+        RateLimit.parse("20 per minute")
+
+
+def test_route_groups():
+    assert route_group("POST", "/auth/login") == "auth"
+    assert route_group("POST", "/chats/abc/messages") == "send"
+    assert route_group("POST", "/chats/abc/regenerate") == "send"
+    assert route_group("GET", "/chats/") == "read"
+    assert route_group("GET", "/profile/me") == "read"
+    assert route_group("DELETE", "/chats/abc") is None
+    assert route_group("GET", "/health") is None
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_exhausts_bucket():
+    backend = MemoryBackend()
+    limit = RateLimit(capacity=3, period=60.0)
+
+    decisions = [await backend.hit("user:1", limit) for _ in range(4)]
+
+    assert [decision.allowed for decision in decisions] == [True, True, True, False]
+    assert 0 < decisions[-1].retry_after <= 20.0
+    assert (await backend.hit("user:2", limit)).allowed
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_keys=2)
+    limit = RateLimit(capacity=1, period=60.0)
+
+    assert (await backend.hit("a", limit)).allowed
+    assert (await backend.hit("b", limit)).allowed
+    assert not (await backend.hit("a", limit)).allowed
+    # "b" is now the oldest key and makes room for "c"; "a" keeps its state.
+    assert (await backend.hit("c", limit)).allowed
+    assert not (await backend.hit("a", limit)).allowed
+    assert (await backend.hit("b", limit)).allowed
+
+
+def test_client_ip_uses_entry_appended_by_trusted_proxy():
+    def client_ip(hops, forwarded):
+        middleware = RateLimitMiddleware(
+            None, backend=MemoryBackend(), limits={}, secret_key="x", proxy_hops=hops
+        )
+        headers = {b"x-forwarded-for": forwarded} if forwarded else {}
+        return middleware._client_ip({"client": ("10.0.0.1", 1234)}, headers)
+
+    assert client_ip(0, b"1.1.1.1") == "10.0.0.1"
+    assert client_ip(1, b"6.6.6.6, 1.1.1.1") == "1.1.1.1"
+    assert client_ip(2, b"6.6.6.6, 1.1.1.1, 10.0.0.2") == "1.1.1.1"
+    assert client_ip(2, b"1.1.1.1") == "10.0.0.1"
+    assert client_ip(1, None) == "10.0.0.1"
+
+
+@pytest.mark.asyncio
+async def test_database_backend_prunes_idle_buckets(db):
+    backend = DatabaseBackend(idle_after=60.0)
+    limit = RateLimit(capacity=2, period=60.0)
+    async with db() as session:
+        session.add(RateLimitBucket(key="old", tokens=0.0, updated_at=0.0))
+        await session.commit()
+
+    assert (await backend.hit("new", limit)).allowed
+
+    async with db() as session:
+        keys = (await session.execute(select(RateLimitBucket.key))).scalars().all()
+    assert keys == ["new"]
@@ -0,0 +1,135 @@
+import uuid
+
+import pytest
+from fastapi import Response
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import database
+from app.auth import (
+    READ_AFTER_HEADER,
+    create_access_token,
+    create_read_after_token,
+    read_after_active,
+)
+from app.config import Settings
+from app.deps import get_current_reader
+from app.models import Base
+from app.routers.auth import login_user, register_user
+from app.schemas import LoginRequest, UserCreate
+
+
+class FakeReplica:
+    def __init__(self, name, healthy=True):
+        self.sessionmaker = name
+        self.healthy = healthy
+
+
+def test_reads_round_robin_over_healthy_replicas(monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", "primary")
+    monkeypatch.setattr(
+        database,
+        "replicas",
+        [FakeReplica("r1"), FakeReplica("r2", healthy=False), FakeReplica("r3")],
+    )
+
+    picks = {database._read_sessionmaker(None) for _ in range(4)}
+
+    assert picks == {"r1", "r3"}
+
+
+def test_recent_writers_read_from_primary(monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", "primary")
+    monkeypatch.setattr(database, "replicas", [FakeReplica("r1")])
+    monkeypatch.setattr(database, "_recent_writers", {})
+    monkeypatch.setattr(database, "_read_your_writes_seconds", 60.0)
+    writer, reader = uuid.uuid4(), uuid.uuid4()
+
+    database.mark_user_write(writer)
+
+    assert database._read_sessionmaker(writer) == "primary"
+    assert database._read_sessionmaker(reader) == "r1"
+
+
+def test_unhealthy_replicas_fall_back_to_primary(monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", "primary")
+    monkeypatch.setattr(database, "replicas", [FakeReplica("r1", healthy=False)])
+
+    assert database._read_sessionmaker(None) == "primary"
+
+
+def test_pinned_reads_use_primary(monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", "primary")
+    monkeypatch.setattr(database, "replicas", [FakeReplica("r1")])
+    monkeypatch.setattr(database, "_recent_writers", {})
+
+    assert database._read_sessionmaker(uuid.uuid4(), pinned=True) == "primary"
+
+
+def test_expired_writers_are_pruned(monkeypatch):
+    monkeypatch.setattr(database, "replicas", [FakeReplica("r1")])
+    monkeypatch.setattr(database, "_read_your_writes_seconds", 5.0)
+    stale, fresh = uuid.uuid4(), uuid.uuid4()
+    monkeypatch.setattr(database, "_recent_writers", {stale: -100.0})
+    monkeypatch.setattr(database, "_writers_pruned_at", -100.0)
+
+    database.mark_user_write(fresh)
+
+    assert list(database._recent_writers) == [fresh]
+
+
+def test_read_after_token_is_bound_to_user_and_expiry():
+    settings = Settings(secret_key="secret", read_your_writes_seconds=5)
+    user_id = uuid.uuid4()
+    token = create_read_after_token(user_id, settings, now=1000)
+
+    assert read_after_active(token, user_id, settings, now=1004)
+    assert not read_after_active(token, user_id, settings, now=1006)
+    assert not read_after_active(token, uuid.uuid4(), settings, now=1004)
+    assert not read_after_active(
+        token, user_id, Settings(secret_key="other"), now=1004
+    )
+    subject, expires, signature = token.split(".")
+    extended = f"{subject}.{int(expires) + 3600}.{signature}"
+    assert not read_after_active(extended, user_id, settings, now=1006)
+    assert not read_after_active("garbage", user_id, settings, now=1004)
+
+
+@pytest.mark.asyncio
+async def test_register_and_login_issue_read_after_tokens(db):
+    settings = Settings(secret_key="secret", database_replica_urls=["replica"])
+    response = Response()
+    async with db() as session:
+        user = await register_user(
+            UserCreate(
+                email="new@example.com", password="password123", display_name="New"
+            ),
+            response,
+            session=session,
+            settings=settings,
+        )
+    assert read_after_active(response.headers[READ_AFTER_HEADER], user.id, settings)
+
+    response = Response()
+    async with db() as session:
+        await login_user(
+            LoginRequest(email="new@example.com", password="password123"),
+            response,
+            session=session,
+            settings=settings,
+        )
+    assert read_after_active(response.headers[READ_AFTER_HEADER], user.id, settings)
+
+
+@pytest.mark.asyncio
+async def test_reader_missing_on_replica_is_loaded_from_primary(db, user, tmp_path):
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    async with replica.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    settings = Settings(secret_key="secret")
+    token = create_access_token(str(user.id), settings)
+
+    async with async_sessionmaker(replica)() as session:
+        reader = await get_current_reader(token, session, settings)
+    await replica.dispose()
+
+    assert reader.id == user.id
@@ -0,0 +1,215 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event, select
+
+from app import database, openrouter
+from app.config import Settings
+from app.events import (
+    GENERATION_CANCELLED,
+    GENERATION_FAILED,
+    GENERATION_PROGRESS,
+    Event,
+    InProcessEventBus,
+)
+from app.models import Chat, Message
+from app.ratelimit import MemoryBackend, RateLimit
+from app.routers.realtime import ChatConnection
+from app.usage import UsageLedger
+
+SETTINGS = Settings(OPEN_ROUTER_API_KEY="key")
+
+
+def _connection(**kwargs):
+    settings = SimpleNamespace(ws_send_queue_size=16)
+    return ChatConnection(
+        None,
+        SimpleNamespace(id=uuid.uuid4()),
+        settings,
+        InProcessEventBus(),
+        None,
+        **kwargs,
+    )
+
+
+def _frames(connection):
+    return [connection.outbox.get_nowait() for _ in range(connection.outbox.qsize())]
+
+
+@pytest.mark.asyncio
+async def test_send_frames_share_the_send_rate_limit():
+    connection = _connection(
+        rate_limit_backend=MemoryBackend(),
+        send_limit=RateLimit(capacity=1, period=60.0),
+    )
+    chat_id = uuid.uuid4()
+
+    assert await connection._allow_send(chat_id)
+    assert not await connection._allow_send(chat_id)
+    (frame,) = _frames(connection)
+    assert frame["type"] == "error"
+    assert frame["retry_after"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_unexpected_errors_end_the_generation():
+    connection = _connection()
+    chat_id = uuid.uuid4()
+
+    async def turn(chat_id, content):
+        connection.in_flight.add(chat_id)
+        raise RuntimeError("database went away")
+
+    async with connection.bus.subscribe(connection.user_id) as queue:
+        await connection._generate(chat_id, turn(chat_id, "hi"))
+        event = queue.get_nowait()
+
+    assert event.type == GENERATION_FAILED
+    assert [frame["type"] for frame in _frames(connection)] == ["error"]
+    assert not connection.in_flight
+
+
+@pytest.mark.asyncio
+async def test_cancelled_generation_is_announced():
+    connection = _connection()
+    chat_id = uuid.uuid4()
+    started = asyncio.Event()
+
+    async def turn(chat_id, content):
+        connection.in_flight.add(chat_id)
+        started.set()
+        await asyncio.Event().wait()
+
+    async with connection.bus.subscribe(connection.user_id) as queue:
+        task = asyncio.create_task(connection._generate(chat_id, turn(chat_id, "hi")))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        event = queue.get_nowait()
+
+    assert event.type == GENERATION_CANCELLED
+    assert _frames(connection) == []
+
+
+@pytest.mark.asyncio
+async def test_regenerate_frames_validate_their_options():
+    connection = _connection()
+
+    await connection._dispatch(
+        {"type": "regenerate", "chat_id": str(uuid.uuid4()), "candidates": 9}
+    )
+
+    (frame,) = _frames(connection)
+    assert frame["detail"] == "Invalid regenerate options."
+    assert not connection.generations
+
+
+async def _chat(db, user):
+    async with db() as session:
+        chat = Chat(user_id=user.id, title="t", model_name="m")
+        session.add(chat)
+        await session.commit()
+    return chat
+
+
+@pytest.mark.asyncio
+async def test_turn_holds_no_connection_while_streaming(db, user, monkeypatch):
+    chat = await _chat(db, user)
+    connections = []
+    checked_out = []
+    pool = database.engine.sync_engine
+    event.listen(pool, "checkout", lambda *args: connections.append(1))
+    event.listen(pool, "checkin", lambda *args: connections.pop())
+
+    async def stream_completion(settings, model, messages, *, temperature=None):
+        checked_out.append(len(connections))
+        assert messages[-1] == {"role": "user", "content": "hi"}
+        yield openrouter.StreamDelta(content="hello")
+
+    monkeypatch.setattr(openrouter, "stream_completion", stream_completion)
+    connection = ChatConnection(None, user, SETTINGS, InProcessEventBus(), UsageLedger())
+
+    await connection._turn(chat.id, "hi")
+
+    assert checked_out == [0]
+    assert [frame["type"] for frame in _frames(connection)] == ["delta", "done"]
+    async with db() as session:
+        stored = await session.get(Chat, chat.id)
+        messages = (
+            await session.execute(select(Message).order_by(Message.role.desc()))
+        ).scalars().all()
+    assert stored.message_count == 2
+    assert [m.content for m in messages] == ["hi", "hello"]
+    assert messages[1].parent_id == messages[0].id
+
+
+@pytest.mark.asyncio
+async def test_turn_for_a_chat_deleted_while_streaming_stores_nothing(
+    db, user, monkeypatch
+):
+    chat = await _chat(db, user)
+
+    async def stream_completion(settings, model, messages, *, temperature=None):
+        async with db() as session:
+            await session.delete(await session.get(Chat, chat.id))
+            await session.commit()
+        yield openrouter.StreamDelta(content="hello")
+
+    monkeypatch.setattr(openrouter, "stream_completion", stream_completion)
+    connection = ChatConnection(None, user, SETTINGS, InProcessEventBus(), UsageLedger())
+
+    await connection._turn(chat.id, "hi")
+
+    assert _frames(connection)[-1]["detail"] == "Chat not found."
+    async with db() as session:
+        assert (await session.execute(select(Message))).scalars().all() == []
+
+
+@pytest.mark.asyncio
+async def test_client_too_slow_for_deltas_aborts_the_stream(db, user, monkeypatch):
+    chat = await _chat(db, user)
+    closed = asyncio.Event()
+
+    async def stream_completion(settings, model, messages, *, temperature=None):
+        try:
+            for part in ("a", "b", "c"):
+                yield openrouter.StreamDelta(content=part)
+        finally:
+            closed.set()
+
+    monkeypatch.setattr(openrouter, "stream_completion", stream_completion)
+    settings = Settings(OPEN_ROUTER_API_KEY="key", ws_send_queue_size=2)
+    connection = ChatConnection(None, user, settings, InProcessEventBus(), UsageLedger())
+
+    task = asyncio.create_task(
+        connection._generate(chat.id, connection._turn(chat.id, "hi"))
+    )
+    await closed.wait()
+    assert [frame["content"] for frame in _frames(connection)] == ["a", "b"]
+    await task
+
+    assert _frames(connection)[-1]["detail"] == "Client is not reading fast enough."
+    async with db() as session:
+        assert (await session.execute(select(Message))).scalars().all() == []
+
+
+@pytest.mark.asyncio
+async def test_progress_of_own_generations_is_not_echoed():
+    connection = _connection()
+    own, other = uuid.uuid4(), uuid.uuid4()
+    connection.generations[own] = asyncio.get_running_loop().create_future()
+    forwarder = asyncio.create_task(connection._forward_events())
+    await asyncio.sleep(0)
+
+    await connection.bus.publish(
+        Event(GENERATION_PROGRESS, connection.user_id, own, {"content": "a"}),
+        Event(GENERATION_PROGRESS, connection.user_id, other, {"content": "b"}),
+    )
+    await asyncio.sleep(0)
+    forwarder.cancel()
+
+    (frame,) = _frames(connection)
+    assert frame["event"]["chat_id"] == str(other)
@@ -0,0 +1,183 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app import openrouter, regeneration
+from app.config import Settings
+from app.events import InProcessEventBus
+from app.models import Chat, Message
+from app.routers.chats import regenerate_message, select_alternative
+from app.schemas import RegenerateRequest
+from app.usage import UsageLedger
+
+SETTINGS = Settings(OPEN_ROUTER_API_KEY="key")
+EARLIER = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+async def _chat_with_turn(db, user, *, reply_parent=True):
+    async with db() as session:
+        chat = Chat(user_id=user.id, title="t", model_name="slow")
+        session.add(chat)
+        await session.flush()
+        turn = Message(chat_id=chat.id, role="user", content="hi", created_at=EARLIER)
+        session.add(turn)
+        await session.flush()
+        reply = Message(
+            chat_id=chat.id,
+            role="assistant",
+            content="first",
+            parent_id=turn.id if reply_parent else None,
+            created_at=EARLIER + timedelta(seconds=1),
+        )
+        session.add(reply)
+        chat.message_count = 2
+        await session.commit()
+    return chat, turn, reply
+
+
+def _fake_complete(delays):
+    async def complete(settings, model, messages, *, temperature=None):
+        delay = delays[model]
+        if isinstance(delay, BaseException):
+            raise delay
+        await asyncio.sleep(delay)
+        return f"from {model}", {"usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    return complete
+
+
+async def _regenerate(db, user, chat, payload):
+    async with db() as session:
+        return await regenerate_message(
+            chat.id,
+            payload,
+            current_user=user,
+            session=session,
+            settings=SETTINGS,
+            ledger=UsageLedger(),
+            bus=InProcessEventBus(),
+        )
+
+
+async def _replies(db, chat):
+    async with db() as session:
+        result = await session.execute(
+            select(Message).where(
+                Message.chat_id == chat.id, Message.role == "assistant"
+            )
+        )
+        return {message.content: message for message in result.scalars()}
+
+
+@pytest.mark.asyncio
+async def test_fastest_candidate_wins_and_others_become_alternatives(
+    db, user, monkeypatch
+):
+    chat, turn, _ = await _chat_with_turn(db, user)
+    monkeypatch.setattr(
+        openrouter, "complete", _fake_complete({"slow": 0.05, "fast": 0})
+    )
+
+    winner = await _regenerate(
+        db, user, chat, RegenerateRequest(candidates=2, models=["slow", "fast"])
+    )
+    await asyncio.gather(*regeneration._background_tasks)
+
+    assert winner.content == "from fast"
+    replies = await _replies(db, chat)
+    assert {content: m.selected for content, m in replies.items()} == {
+        "first": False,
+        "from fast": True,
+        "from slow": False,
+    }
+    assert {m.parent_id for m in replies.values()} == {turn.id}
+
+
+@pytest.mark.asyncio
+async def test_unreachable_upstream_is_a_bad_gateway(db, user, monkeypatch):
+    chat, _, _ = await _chat_with_turn(db, user)
+    monkeypatch.setattr(
+        openrouter, "complete", _fake_complete({"slow": httpx.ConnectError("down")})
+    )
+
+    with pytest.raises(HTTPException) as error:
+        await _regenerate(db, user, chat, RegenerateRequest())
+
+    assert error.value.status_code == 502
+
+
+@pytest.mark.asyncio
+async def test_replaced_reply_without_parent_can_be_selected_again(
+    db, user, monkeypatch
+):
+    chat, turn, reply = await _chat_with_turn(db, user, reply_parent=False)
+    monkeypatch.setattr(openrouter, "complete", _fake_complete({"slow": 0}))
+    await _regenerate(db, user, chat, RegenerateRequest())
+
+    async with db() as session:
+        selected = await select_alternative(
+            chat.id,
+            reply.id,
+            current_user=user,
+            session=session,
+            bus=InProcessEventBus(),
+        )
+
+    assert selected.parent_id == turn.id
+    replies = await _replies(db, chat)
+    assert replies["first"].selected
+    assert not replies["from slow"].selected
+
+
+@pytest.mark.asyncio
+async def test_orphan_replies_are_linked_to_their_turn(db, user):
+    chat, turn, reply = await _chat_with_turn(db, user, reply_parent=False)
+    other, other_turn, _ = await _chat_with_turn(db, user, reply_parent=False)
+    async with db() as session:
+        # No earlier user message: stays unlinked without stalling the walk.
+        session.add(
+            Message(
+                chat_id=chat.id,
+                role="assistant",
+                content="greeting",
+                created_at=EARLIER - timedelta(seconds=1),
+            )
+        )
+        await session.commit()
+
+    assert await regeneration.link_orphan_replies(batch_size=1) == 2
+
+    replies = await _replies(db, chat)
+    assert replies["first"].parent_id == turn.id
+    assert replies["greeting"].parent_id is None
+    assert (await _replies(db, other))["first"].parent_id == other_turn.id
+
+
+@pytest.mark.asyncio
+async def test_stream_race_forwards_only_the_first_to_answer(monkeypatch):
+    async def stream_completion(settings, model, messages, *, temperature=None):
+        if model == "slow":
+            await asyncio.sleep(0.05)
+        for part in (model, "!"):
+            yield openrouter.StreamDelta(content=part)
+            await asyncio.sleep(0)
+
+    monkeypatch.setattr(openrouter, "stream_completion", stream_completion)
+    forwarded = []
+
+    async def forward(content):
+        forwarded.append(content)
+
+    race = regeneration.StreamRace(
+        SETTINGS, [("slow", 1.0), ("fast", 1.0)], lambda model: [], forward
+    )
+    winner = await (await race.decide())
+    (loser,) = race.losers()
+
+    assert winner.content == "fast!"
+    assert forwarded == ["fast", "!"]
+    assert (await loser).content == "slow!"
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.models import Chat, Message
+from app.summaries import PREVIEW_LENGTH, make_preview, refresh_chat_summaries
+
+
+def test_preview_collapses_whitespace():
+    assert make_preview("  hello\n\n  world\t!") == "hello world !"
+
+
+def test_preview_is_truncated():
+    preview = make_preview("x" * (PREVIEW_LENGTH * 2))
+    assert len(preview) == PREVIEW_LENGTH
+    assert preview.endswith("…")
+
+
+@pytest.mark.asyncio
+async def test_refresh_matches_incremental_preview(db, user):
+    async with db() as session:
+        chat = Chat(user_id=user.id, title="t", model_name="m")
+        session.add(chat)
+        await session.flush()
+        session.add_all(
+            [
+                Message(chat_id=chat.id, role="user", content="hi"),
+                Message(
+                    chat_id=chat.id,
+                    role="assistant",
+                    content="  hello \n\n world " + "x" * PREVIEW_LENGTH,
+                    created_at=datetime.now(timezone.utc) + timedelta(seconds=1),
+                ),
+            ]
+        )
+        await session.commit()
+        updated_at = chat.updated_at
+
+        await refresh_chat_summaries(session, [chat.id])
+        await session.commit()
+        await session.refresh(chat)
+
+    assert chat.message_count == 2
+    assert chat.last_message_preview == make_preview(
+        "  hello \n\n world " + "x" * PREVIEW_LENGTH
+    )
+    assert chat.updated_at == updated_at
@@ -0,0 +1,143 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.models import Chat, Message
+from app.transfer import (
+    ImportFormatError,
+    _encode_line,
+    import_records,
+    iter_export_lines,
+    iter_ndjson_records,
+)
+
+
+def iter_lines(records):
+    return (_encode_line(record) for record in records)
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+async def _collect(data: bytes, **kwargs):
+    return [record async for record in iter_ndjson_records(_chunks(data), **kwargs)]
+
+
+RECORDS = [
+    {"type": "export", "version": 1},
+    {"type": "chat", "id": "a", "title": "Привіт"},
+    {"type": "message", "chat_id": "a", "role": "user", "content": "line\nbreak"},
+]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_roundtrip_plain():
+    data = b"".join(iter_lines(RECORDS))
+    assert await _collect(data) == RECORDS
+
+
+@pytest.mark.asyncio
+async def test_ndjson_roundtrip_gzip():
+    data = gzip.compress(b"".join(iter_lines(RECORDS)))
+    assert await _collect(data, compressed=True) == RECORDS
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rejects_invalid_json():
+    with pytest.raises(ImportFormatError):
+        await _collect(b'{"type": "chat"}\nnot json\n')
+
+
+def test_lines_are_single_line_json():
+    lines = list(iter_lines(RECORDS))
+    assert all(line.count(b"\n") == 1 for line in lines)
+    assert json.loads(lines[1]) == RECORDS[1]
+
+
+async def _records(records):
+    for record in records:
+        yield record
+
+
+IMPORT = [
+    {"type": "export", "version": 1},
+    {"type": "chat", "id": "a", "title": "Imported", "model_name": "m" * 150},
+    {
+        "type": "message",
+        "chat_id": "a",
+        "role": "user",
+        "content": "hi",
+        "created_at": "2025-01-01T10:00:00+00:00",
+    },
+    {
+        "type": "message",
+        "chat_id": "a",
+        "role": "assistant",
+        "content": "hello there",
+        "model_name": "x" * 150,
+        "created_at": "2025-01-01T10:00:01+00:00",
+    },
+]
+
+
+@pytest.mark.asyncio
+async def test_import_then_export(db, user):
+    async with db() as session:
+        counts = await import_records(
+            session, user.id, _records(IMPORT), default_model="default", batch_size=1
+        )
+        await session.commit()
+    assert counts == (1, 2)
+
+    async with db() as session:
+        chat = (await session.execute(select(Chat))).scalar_one()
+        models = (await session.execute(select(Message.model_name))).scalars().all()
+    assert len(chat.model_name) == 100
+    assert chat.message_count == 2
+    assert chat.last_message_preview == "hello there"
+    assert sorted(len(m) for m in models if m) == [100]
+
+    lines = [json.loads(line) async for line in iter_export_lines(user.id)]
+    assert [line["type"] for line in lines] == ["export", "chat", "message", "message"]
+    assert [line["content"] for line in lines[2:]] == ["hi", "hello there"]
+
+
+@pytest.mark.asyncio
+async def test_export_keeps_prompt_before_reply_with_equal_timestamps(db, user):
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    async with db() as session:
+        chat = Chat(user_id=user.id, title="t", model_name="m")
+        session.add(chat)
+        await session.flush()
+        for role in ("assistant", "user"):
+            session.add(
+                Message(
+                    chat_id=chat.id, role=role, content=role, created_at=created_at
+                )
+            )
+        await session.commit()
+
+    lines = [json.loads(line) async for line in iter_export_lines(user.id)]
+    assert [line["content"] for line in lines[2:]] == ["user", "assistant"]
+
+
+@pytest.mark.asyncio
+async def test_import_rejects_invalid_message_model(db, user):
+    records = IMPORT[:3] + [{**IMPORT[3], "model_name": 5}]
+    async with db() as session:
+        with pytest.raises(ImportFormatError):
+            await import_records(
+                session, user.id, _records(records), default_model="default"
+            )
+
+
+@pytest.mark.asyncio
+async def test_gzip_bomb_line_is_rejected():
+    data = gzip.compress(b"x" * (4 * 1024 * 1024))
+    with pytest.raises(ImportFormatError):
+        await _collect(data, compressed=True)
@@ -0,0 +1,112 @@
+import asyncio
+import uuid
+from datetime import date
+
+import pytest
+
+from app.models import UsageDaily
+from app.usage import UsageLedger, _today, parse_usage
+
+
+def test_parse_usage_reads_openrouter_counts():
+    data = {
+        "usage": {
+            "prompt_tokens": 12,
+            "completion_tokens": 30,
+            "prompt_tokens_details": {"cached_tokens": 8},
+        }
+    }
+    assert parse_usage(data) == (12, 30, 8)
+    assert parse_usage({}) == (0, 0, 0)
+
+
+def test_ledger_aggregates_pending_increments():
+    ledger = UsageLedger()
+    user_id, chat_id = uuid.uuid4(), uuid.uuid4()
+    for _ in range(3):
+        ledger.record(
+            user_id=user_id,
+            chat_id=chat_id,
+            model_name="test-model",
+            prompt_tokens=10,
+            completion_tokens=5,
+            latency_ms=100,
+        )
+
+    pending = ledger.pending_for_user(user_id)
+    assert len(pending) == 1
+    (delta,) = pending.values()
+    assert delta.request_count == 3
+    assert delta.total_tokens == 45
+    assert delta.latency_ms == 300
+    assert ledger.pending_for_user(uuid.uuid4()) == {}
+
+
+@pytest.mark.asyncio
+async def test_quota_seed_waits_for_running_flush(db, user, monkeypatch):
+    ledger = UsageLedger()
+    chat_id = uuid.uuid4()
+    ledger.record(
+        user_id=user.id,
+        chat_id=chat_id,
+        model_name="test-model",
+        prompt_tokens=10,
+        completion_tokens=5,
+        latency_ms=100,
+    )
+
+    release = asyncio.Event()
+    upsert = UsageLedger._upsert
+
+    async def slow_upsert(session, batch):
+        await release.wait()
+        await upsert(session, batch)
+
+    monkeypatch.setattr(ledger, "_upsert", slow_upsert)
+    flush = asyncio.create_task(ledger.flush())
+    await asyncio.sleep(0)
+    assert ledger.pending_for_user(user.id) == {}
+
+    async with db() as session:
+        seed = asyncio.create_task(ledger.tokens_used_today(session, user.id))
+        await asyncio.sleep(0.01)
+        release.set()
+        await flush
+        assert await seed == 15
+
+
+@pytest.mark.asyncio
+async def test_flush_picks_up_other_workers_usage(db, user):
+    ledger = UsageLedger(daily_token_quota=100)
+    async with db() as session:
+        assert not await ledger.quota_exceeded(session, user.id)
+    ledger._tokens_today[uuid.uuid4()] = (date(2000, 1, 1), 5)
+    ledger.record(
+        user_id=user.id,
+        chat_id=uuid.uuid4(),
+        model_name="test-model",
+        prompt_tokens=10,
+        completion_tokens=0,
+        latency_ms=1,
+    )
+
+    async with db() as session:
+        # Another worker flushed its share of the quota.
+        session.add(
+            UsageDaily(
+                day=_today(),
+                user_id=user.id,
+                chat_id=uuid.uuid4(),
+                model_name="test-model",
+                request_count=1,
+                prompt_tokens=90,
+                completion_tokens=0,
+                latency_ms=1,
+            )
+        )
+        await session.commit()
+        await ledger.flush()
+
+        assert await ledger.tokens_used_today(session, user.id) == 100
+        assert await ledger.quota_exceeded(session, user.id)
+    assert list(ledger._tokens_today) == [user.id]
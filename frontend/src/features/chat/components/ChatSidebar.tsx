@@ -113,11 +113,15 @@ export const ChatSidebar = ({
             aria-current={chat.id === activeChatId ? 'true' : undefined}
           >
             <span className="chat-item-title">{chat.title}</span>
+            {chat.last_message_preview && (
+              <span className="chat-item-preview">{chat.last_message_preview}</span>
+            )}
             <span className="chat-item-meta">
               {new Date(chat.updated_at).toLocaleDateString(undefined, {
                 hour: '2-digit',
                 minute: '2-digit',
               })}
+              {chat.message_count > 0 && ` · ${chat.message_count} messages`}
             </span>
           </button>
         ))
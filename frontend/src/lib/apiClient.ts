@@ -1,11 +1,20 @@
 import axios from 'axios';
 
 const baseURL = import.meta.env.VITE_API_BASE_URL ?? 'http://localhost:8000';
+const READ_AFTER_HEADER = 'X-Read-After';
 
 let currentToken: string | null = null;
+// Signed by the API after each write; echoing it keeps our reads on the primary
+// until replicas have caught up, whichever worker serves them.
+let readAfterToken: string | null = null;
 
 export const setAuthToken = (token: string | null) => {
   currentToken = token;
+  readAfterToken = null;
+};
+
+export const setReadAfterToken = (token: string | null) => {
+  readAfterToken = token;
 };
 
 export const apiClient = axios.create({
@@ -17,6 +26,16 @@ apiClient.interceptors.request.use((config) => {
   if (currentToken) {
     config.headers.setAuthorization(`Bearer ${currentToken}`);
   }
+  if (readAfterToken) {
+    config.headers.set(READ_AFTER_HEADER, readAfterToken);
+  }
   return config;
 });
 
+apiClient.interceptors.response.use((response) => {
+  const token = response.headers[READ_AFTER_HEADER.toLowerCase()];
+  if (typeof token === 'string' && token) {
+    readAfterToken = token;
+  }
+  return response;
+});
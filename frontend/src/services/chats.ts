@@ -4,6 +4,7 @@ import type {
   ChatDetail,
   CreateChatRequest,
   Message,
+  RegenerateRequest,
   SendMessageRequest,
   UpdateChatRequest,
 } from '../types/api';
@@ -45,3 +46,18 @@ export const sendMessage = async (
   return response.data;
 };
 
+
+export const regenerateMessage = async (
+  chatId: string,
+  payload: RegenerateRequest = {},
+): Promise<Message> => {
+  const response = await apiClient.post<Message>(`/chats/${chatId}/regenerate`, payload);
+  return response.data;
+};
+
+export const selectAlternative = async (chatId: string, messageId: string): Promise<Message> => {
+  const response = await apiClient.post<Message>(
+    `/chats/${chatId}/messages/${messageId}/select`,
+  );
+  return response.data;
+};
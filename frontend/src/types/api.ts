@@ -41,6 +41,9 @@ export interface Chat {
   id: string;
   title: string;
   model_name: string;
+  message_count: number;
+  last_message_at: string | null;
+  last_message_preview: string | null;
   created_at: string;
   updated_at: string;
 }
@@ -55,6 +58,8 @@ export interface Message {
   role: 'user' | 'assistant' | 'system';
   content: string;
   model_name: string | null;
+  parent_id: string | null;
+  selected: boolean;
   created_at: string;
 }
 
@@ -71,3 +76,9 @@ export interface SendMessageRequest {
   content: string;
 }
 
+export interface RegenerateRequest {
+  candidates?: number;
+  temperatures?: number[];
+  models?: string[];
+}
+